@@ -4,6 +4,8 @@ from os import listdir
 import os
 import csv
 from application_logging.logger import AppLogger
+from data_validation.file_validator import TypedRowParser
+from data_ingestion.columnar_cache import ColumnarCache
 
 
 class DBOperation:
@@ -67,45 +69,73 @@ class DBOperation:
             self.logger.log(file, "Closed %s database successfully" % database_name)
             file.close()
 
-    def insert_good_data_into_table(self, database):
+    def count_rows_in_table(self, database):
         """
-        This method inserts the Good data files from the Good_Raw folder into the above created table in the database.
+        This method returns the number of rows in the Good_Raw_Data table.
+        params: database
+        returns: row count
+        """
+        conn = self.create_data_base_connection(database)
+        row_count = conn.execute("SELECT count(*) FROM Good_Raw_Data").fetchone()[0]
+        conn.close()
+        return row_count
+
+    def clear_good_data_table(self, database):
+        """
+        This method deletes all the rows of the Good_Raw_Data table, so that the data can be inserted again from
+        scratch.
         params: database
-        Iterate over all files in the good data directory --> open each file --> get the values in each line -->
-        write to the database table --> close the connection.
         returns: None
         """
         conn = self.create_data_base_connection(database)
-        good_file_path = self.goodFilePath
-        bad_file_path = self.badFilePath
+        conn.execute("DELETE FROM Good_Raw_Data")
+        conn.commit()
+        conn.close()
+        file = open("Training_Logs/DbInsertLog.txt", 'a+')
+        self.logger.log(file, "Good_Raw_Data table cleared!!")
+        file.close()
+
+    def insert_good_data_into_table(self, database, manifest=None):
+        """
+        This method inserts the Good data files from the Good_Raw folder into the above created table in the database.
+        params: database, manifest (optional FileManifest recording the inserted files)
+        Get the column types of the table --> iterate over all files in the good data directory --> parse the rows of
+        each file into typed tuples --> insert them in bulk within one transaction per file and record the file as
+        inserted in the manifest in the same transaction --> if the file can't be inserted, roll back its rows and
+        move it to the bad data directory --> close the connection.
+        returns: None
+        """
+        conn = self.create_data_base_connection(database)
+        column_types = [column[2] for column in conn.execute('PRAGMA table_info(Good_Raw_Data)')]
+        parser = TypedRowParser(column_types)
+        insert_query = 'INSERT INTO Good_Raw_Data VALUES ({})'.format(', '.join(['?'] * len(column_types)))
         log_file = open("Training_Logs/DbInsertLog.txt", 'a+')
-        for file in listdir(good_file_path):
+        for file in sorted(listdir(self.goodFilePath)):
             try:
-                with open(good_file_path + '/' + file, "r") as f:
-                    next(f)
-                    reader = csv.reader(f, delimiter="\n")
-                    for idx, line in enumerate(reader):
-                        for values in line:
-                            print(values)
-                            conn.execute('INSERT INTO Good_Raw_Data values ({values})'.format(values=values))
-                            self.logger.log(log_file, " %s: File loaded successfully!!" % file)
-                            conn.commit()
+                with open(self.goodFilePath + '/' + file, "r", newline='') as f:
+                    reader = csv.reader(f)
+                    next(reader)  # skip the header
+                    with conn:  # one transaction per file, rolled back if any of its rows fails
+                        cursor = conn.executemany(insert_query, (parser.parse(row) for row in reader))
+                        if manifest is not None:
+                            manifest.mark_inserted(file, cursor.rowcount, conn)
+                self.logger.log(log_file, " %s: File loaded successfully!!" % file)
             except Exception as e:
-                conn.rollback()
-                self.logger.log(log_file, "Error while creating table: %s " % e)
-                shutil.move(good_file_path + '/' + file, bad_file_path)
+                if manifest is not None:
+                    manifest.mark_bad(file, "Insertion failed: %s" % e)
+                self.logger.log(log_file, "Error while inserting the file %s: %s " % (file, e))
+                shutil.move(self.goodFilePath + '/' + file, self.badFilePath)
                 self.logger.log(log_file, "File Moved Successfully %s" % file)
-                log_file.close()
-                conn.close()
         conn.close()
         log_file.close()
 
-    def export_good_data_to_csv(self, database):
+    def export_good_data_to_csv(self, database, batch_size=10000):
         """
-        This method exports the data in the good_data table to a csv file.
-        params: database
+        This method exports the data in the good_data table to a csv file. The rows are streamed from the cursor in
+        batches, so the memory used does not depend on the size of the table.
+        params: database, batch_size (number of rows fetched at a time)
         Select the data from Good_Raw_Data directory --> get the headers of the file --> create the csv file
-        --> write headers to csv --> write the data to the csv file.
+        --> write headers to csv --> fetch the rows batch by batch and write them to the csv file.
         returns: None
         """
         file_from_db = 'Training_FileFromDB/'
@@ -115,17 +145,32 @@ class DBOperation:
         sql_select = "SELECT *  FROM Good_Raw_Data"
         cursor = conn.cursor()
         cursor.execute(sql_select)
-        results = cursor.fetchall()
         # Get the headers of the csv file
         headers = [i[0] for i in cursor.description]
         # Make the CSV output directory
         if not os.path.isdir(file_from_db):
             os.makedirs(file_from_db)
-        # Open CSV file for writing.
-        csv_file = csv.writer(open(file_from_db + file_name, 'w', newline=''), delimiter=',',
-                              lineterminator='\r\n', quoting=csv.QUOTE_ALL, escapechar='\\')
-        # Add the headers and data to the CSV file.
-        csv_file.writerow(headers)
-        csv_file.writerows(results)
+        # Open CSV file for writing. Only the values which need it are quoted, the numbers are written as they are.
+        with open(file_from_db + file_name, 'w', newline='') as f:
+            csv_file = csv.writer(f, delimiter=',', lineterminator='\r\n')
+            # Add the headers and data to the CSV file.
+            csv_file.writerow(headers)
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                csv_file.writerows(rows)
+                rows = cursor.fetchmany(batch_size)
+        conn.close()
         self.logger.log(log_file, "File exported successfully!!!")
         log_file.close()
+
+    def export_good_data_to_columnar_cache(self, database, batch_size=100000):
+        """
+        This method exports the data in the good_data table to the columnar binary cache read by the data loaders.
+        params: database, batch_size (number of rows fetched at a time)
+        Stream the rows of the table into one compact .npy file per column --> replace the previous cache.
+        returns: None
+        """
+        log_file = open("Training_Logs/ExportToCsv.txt", 'a+')
+        ColumnarCache('Training_FileFromDB/columns').write_from_database(self.path + database + '.db', batch_size)
+        self.logger.log(log_file, "Columnar cache exported successfully!!!")
+        log_file.close()
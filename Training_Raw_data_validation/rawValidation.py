@@ -6,6 +6,7 @@ import json
 import shutil
 import pandas as pd
 from application_logging.logger import AppLogger
+from data_validation.file_validator import BatchFileValidator
 
 
 class RawDataValidation:
@@ -188,6 +189,42 @@ class RawDataValidation:
                 self.logger.log(f, "Invalid File Name!! File moved to Bad Raw Folder :: %s" % filename)
         f.close()
 
+    def validate_files_single_pass(self, regex, length_of_date_stamp_in_file, length_of_time_stamp_in_file,
+                                   number_of_columns, n_jobs=1, filenames=None):
+        """
+        This method performs the file name, number of columns and missing values in column validations of the
+        training files in one pass, reading every file only once.
+        params: regex, length_of_date_stamp_in_file, length_of_time_stamp_in_file, number_of_columns, n_jobs,
+        filenames (files of the batch directory to validate, all the files when None)
+        Delete and recreate the good and bad raw folders --> validate the files in the batch directory in chunks,
+        across n_jobs worker processes --> merge the verdicts in file name order --> hard link the good files into
+        Good_Raw, only the files with missing values are rewritten with "NULL" in place of the missing values --> hard
+        link the bad files into Bad_Raw.
+        returns: list of verdicts
+        """
+        self.delete_existing_bad_data_training_folder()
+        self.delete_existing_good_data_training_folder()
+        self.create_directory_for_good_bad_raw_data()
+        validator = BatchFileValidator(regex, length_of_date_stamp_in_file, length_of_time_stamp_in_file,
+                                       number_of_columns)
+        verdicts = list()
+        f = open("Training_Logs/fileValidationLog.txt", 'a+')
+        self.logger.log(f, "Single Pass File Validation Started!!")
+        if filenames is None:
+            filenames = listdir(self.Batch_Directory)
+        for verdict in validator.validate_files(self.Batch_Directory, sorted(filenames), n_jobs):
+            filename = verdict.filename
+            validator.place_file(self.Batch_Directory, verdict, "Training_Raw_files_validated/Good_Raw",
+                                 "Training_Raw_files_validated/Bad_Raw")
+            if verdict.is_good:
+                self.logger.log(f, "Valid File!! File moved to GoodRaw Folder :: %s" % filename)
+            else:
+                self.logger.log(f, "%s for the file!! File moved to Bad Raw Folder :: %s" % (verdict.reason, filename))
+            verdicts.append(verdict)
+        self.logger.log(f, "Single Pass File Validation Completed!!")
+        f.close()
+        return verdicts
+
     def validate_number_of_columns_in_file(self, number_of_columns):
         """
         This method is used to check whether the file has the correct number of columns.
@@ -0,0 +1,81 @@
+"""
+Compare the latency of the random forest predictions of sklearn and of the flattened inference engine FlatForest, at
+several batch sizes, and check that both predict the same classes and probabilities. Run from the project directory:
+
+    python benchmarks/forest_inference_benchmark.py --batch-sizes 1 100 100000
+    python benchmarks/forest_inference_benchmark.py --model models/versions/<version>/RFC2.sav
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_operations.model_registry import ModelRegistry  # noqa: E402
+from model_inference.flat_forest import FlatForest  # noqa: E402
+
+
+def synthetic_forest(n_estimators, max_depth, n_features, train_rows):
+    """
+    This function trains a forest on random data shaped like the credit card data.
+    params: n_estimators, max_depth (0 for unbounded trees), n_features, train_rows
+    returns: forest
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    random_state = np.random.RandomState(42)
+    x = random_state.randn(train_rows, n_features)
+    y = (x[:, 0] + x[:, 1] * x[:, 2] + random_state.randn(train_rows) > 0.5).astype(int)
+    return RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth or None, random_state=42).fit(x, y)
+
+
+def median_seconds(predict, x, repeat):
+    """
+    This function returns the median time of a prediction over repeat runs.
+    params: predict, x, repeat
+    returns: seconds
+    """
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(x)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Random forest inference benchmark')
+    parser.add_argument('--model', help='saved forest (.sav file or array format directory), a synthetic one if none')
+    # the largest forests of the RF_PARAM_GRID of ModelFinder
+    parser.add_argument('--n-estimators', type=int, default=500)
+    parser.add_argument('--max-depth', type=int, default=7, help='0 for unbounded trees')
+    parser.add_argument('--train-rows', type=int, default=30000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    if args.model:
+        model = ModelRegistry.read_model(args.model)
+        model = getattr(model, 'rebuild', lambda: model)()  # a forest in the array format is scored as rebuilt
+    else:
+        model = synthetic_forest(args.n_estimators, args.max_depth, 23, args.train_rows)
+    start = time.perf_counter()
+    flat_forest = FlatForest.compile(model)
+    if flat_forest is None:
+        parser.error('%s is not a random forest classifier' % args.model)
+    print('%s trees, %s nodes, compiled in %.3fs' % (len(flat_forest.roots), len(flat_forest.nodes),
+                                                     time.perf_counter() - start))
+    random_state = np.random.RandomState(0)
+    for batch_size in args.batch_sizes:
+        x = random_state.randn(batch_size, flat_forest.n_features).astype(np.float32)
+        same = (np.array_equal(model.predict_proba(x), flat_forest.predict_proba(x)) and
+                np.array_equal(model.predict(x), flat_forest.predict(x)))
+        sklearn_seconds = median_seconds(model.predict, x, args.repeat)
+        flat_seconds = median_seconds(flat_forest.predict, x, args.repeat)
+        print('batch %-7s sklearn %9.2fms  flat %9.2fms  speedup %6.1fx  identical predictions: %s'
+              % (batch_size, sklearn_seconds * 1000, flat_seconds * 1000, sklearn_seconds / flat_seconds, same))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Measure the cold start of a web worker: the time a fresh interpreter takes to import the main module, and which heavy
+modules get loaded by it. Run from the project directory:
+
+    python benchmarks/startup_benchmark.py --repeat 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# modules only the training path needs, a worker serving predictions should not load them
+HEAVY_MODULES = ['sklearn', 'sklearn.ensemble', 'sklearn.cluster', 'imblearn', 'kneed', 'matplotlib',
+                 'matplotlib.pyplot']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure(module, repeat):
+    """
+    This function imports the module in fresh interpreters and returns the import times and the heavy modules loaded.
+    params: module, repeat
+    returns: list of seconds, list of loaded heavy modules
+    """
+    project_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times, loaded = list(), list()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', PROBE % (module, HEAVY_MODULES)], cwd=project_directory,
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        loaded = result['loaded']
+    return times, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker cold start benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modules', nargs='+', default=['main', 'predict_with_models', 'train_model'])
+    args = parser.parse_args()
+    for module in args.modules:
+        times, loaded = measure(module, args.repeat)
+        print('%-22s median %.3fs  min %.3fs  heavy modules loaded: %s'
+              % (module, statistics.median(times), min(times), ', '.join(loaded) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
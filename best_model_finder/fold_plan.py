@@ -0,0 +1,89 @@
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+
+class FoldPlan:
+    """
+    This class holds the cross validation folds of a cluster, shared by the searches of all the model families so
+    they are compared on identical folds. The rows of every fold are sliced once, when the plan is created, so the
+    worker processes of the searches receive the slices with the plan instead of slicing the folds again, and the
+    per-class statistics of the folds are cached for the naive bayes search.
+    """
+
+    def __init__(self, train_x, train_y, n_splits=5):
+        self.train_x = np.asarray(train_x)
+        self.train_y = np.asarray(train_y)
+        self.n_splits = n_splits
+        # the folds GridSearchCV(cv=n_splits) uses for a classifier
+        self.folds = list(StratifiedKFold(n_splits=n_splits).split(self.train_x, self.train_y))
+        self.fold_slices = [(self.train_x[train_rows], self.train_y[train_rows], self.train_x[test_rows],
+                             self.train_y[test_rows]) for train_rows, test_rows in self.folds]
+        self.class_stats = None
+
+    def fold_data(self, k):
+        """
+        This method returns the training and validation rows of a fold.
+        params: k (fold number)
+        returns: fold_train_x, fold_train_y, fold_test_x, fold_test_y
+        """
+        return self.fold_slices[k]
+
+    def class_statistics(self):
+        """
+        This method computes the statistics GaussianNB fits on the training rows of every fold.
+        params: None
+        For every fold: the classes, the per-class means, variances and priors, and the largest feature variance the
+        variance smoothing is proportional to. They are computed the same way as GaussianNB.fit computes them.
+        returns: list of (classes, means, variances, priors, max_variance) per fold
+        """
+        if self.class_stats is None:
+            self.class_stats = list()
+            for k in range(self.n_splits):
+                fold_train_x, fold_train_y = self.fold_data(k)[:2]
+                classes, counts = np.unique(fold_train_y, return_counts=True)
+                means = np.zeros((len(classes), fold_train_x.shape[1]))
+                variances = np.zeros((len(classes), fold_train_x.shape[1]))
+                for j, c in enumerate(classes):
+                    class_x = fold_train_x[fold_train_y == c]
+                    means[j] = np.mean(class_x, axis=0)
+                    variances[j] = np.var(class_x, axis=0)
+                self.class_stats.append((classes, means, variances, counts / counts.sum(),
+                                         np.var(fold_train_x, axis=0).max()))
+        return self.class_stats
+
+    def naive_bayes_joint_log_likelihood(self, k, var_smoothing):
+        """
+        This method computes the joint log likelihood GaussianNB gives the validation rows of a fold, from the cached
+        class statistics of the fold.
+        params: k (fold number), var_smoothing
+        Add the variance smoothing times the largest feature variance to the class variances --> compute the log
+        prior plus the gaussian log likelihood of the validation rows for every class.
+        returns: classes, joint log likelihood matrix (one row per validation row, one column per class)
+        """
+        classes, means, variances, priors, max_variance = self.class_statistics()[k]
+        fold_test_x = self.fold_data(k)[2]
+        smoothed = variances + var_smoothing * max_variance
+        joint_log_likelihood = np.empty((len(fold_test_x), len(classes)))
+        for j in range(len(classes)):
+            likelihood = -0.5 * np.sum(np.log(2. * np.pi * smoothed[j, :]))
+            likelihood -= 0.5 * np.sum(((fold_test_x - means[j, :]) ** 2) / smoothed[j, :], 1)
+            joint_log_likelihood[:, j] = np.log(priors[j]) + likelihood
+        return classes, joint_log_likelihood
+
+    def naive_bayes_scores(self, var_smoothing_values):
+        """
+        This method computes the validation accuracy of GaussianNB for every variance smoothing on every fold, from
+        the cached class statistics instead of fitting a model per value and fold.
+        params: var_smoothing_values
+        For every fold --> for every variance smoothing, compute the joint log likelihood of the validation rows for
+        every class --> predict the class with the largest one --> compute the accuracy.
+        returns: array of accuracies, one row per variance smoothing and one column per fold
+        """
+        scores = np.empty((len(var_smoothing_values), self.n_splits))
+        for k in range(self.n_splits):
+            fold_test_y = self.fold_data(k)[3]
+            for i, var_smoothing in enumerate(var_smoothing_values):
+                classes, joint_log_likelihood = self.naive_bayes_joint_log_likelihood(k, var_smoothing)
+                predictions = classes[np.argmax(joint_log_likelihood, axis=1)]
+                scores[i, k] = np.mean(predictions == fold_test_y)
+        return scores
@@ -0,0 +1,172 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import sklearn
+
+# bump when the search itself changes in a way the fingerprint can't see, so the old results are not reused
+CACHE_VERSION = 2
+
+
+class SearchCache:
+    """
+    This class memoizes the results of the model search of a cluster. The entries are keyed by a fingerprint of the
+    training and test data, the parameter grids, the search settings and the library versions, and hold the best
+    parameters, the scores and the chosen model. At most max_entries entries taking at most max_bytes on disk are
+    kept, the least recently used ones being evicted.
+    """
+
+    def __init__(self, directory='Training_Search_Cache', max_entries=50, max_bytes=2 << 30):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes  # bound on the size of the result and model files of all the entries
+
+    @staticmethod
+    def fingerprint(arrays, settings):
+        """
+        This method computes the key of a search.
+        params: arrays (training and test matrices and labels), settings (json serializable search settings)
+        Hash the shape, the dtype and the bytes of every array --> hash the settings and the versions of the
+        libraries.
+        returns: hexadecimal key
+        """
+        digest = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(str((array.shape, array.dtype.str)).encode())
+            digest.update(array.data if array.dtype != object else pickle.dumps(array))
+        versions = {'cache': CACHE_VERSION, 'numpy': np.__version__, 'sklearn': sklearn.__version__}
+        digest.update(json.dumps([settings, versions], sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def paths(self, key):
+        """
+        This method returns the paths of the files of an entry.
+        params: key
+        returns: result path, model path
+        """
+        return os.path.join(self.directory, key + '.json'), os.path.join(self.directory, key + '.sav')
+
+    def get(self, key):
+        """
+        This method looks up a search result.
+        params: key
+        Read the result --> load the model if it was stored --> mark the entry as recently used.
+        returns: result dictionary and model (None when it can't be loaded), or None, None when not cached
+        """
+        result_path, model_path = self.paths(key)
+        try:
+            with open(result_path, 'r') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        model = None
+        try:
+            with open(model_path, 'rb') as f:
+                model = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            pass  # the caller refits the model from the cached parameters
+        os.utime(result_path, None)
+        return result, model
+
+    def put(self, key, result, model=None):
+        """
+        This method stores a search result.
+        params: key, result (json serializable dictionary), model
+        Write the result and the model to temporary files --> rename them in place, so a reader never sees a partial
+        entry --> evict the least recently used entries.
+        returns: None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        result_path, model_path = self.paths(key)
+        if model is not None:
+            with open(model_path + '.tmp', 'wb') as f:
+                pickle.dump(model, f)
+            os.replace(model_path + '.tmp', model_path)
+        with open(result_path + '.tmp', 'w') as f:
+            json.dump(result, f, default=str)
+        os.replace(result_path + '.tmp', result_path)
+        self.evict()
+
+    def entries(self):
+        """
+        This method lists the cached entries, the most recently used first.
+        params: None
+        Find the result files --> get the time they were last used --> add up the size of the result and model files
+        of every entry.
+        returns: list of (key, size in bytes)
+        """
+        if not os.path.isdir(self.directory):
+            return list()
+        keys = [name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json')]
+        mtimes, sizes = dict(), dict()
+        for key in keys:
+            result_path, model_path = self.paths(key)
+            try:
+                mtimes[key] = os.path.getmtime(result_path)
+                sizes[key] = os.path.getsize(result_path)
+            except OSError:  # removed by another process
+                continue
+            try:
+                sizes[key] += os.path.getsize(model_path)
+            except OSError:  # entry stored without its model
+                pass
+        return [(key, sizes[key]) for key in sorted(mtimes, key=mtimes.get, reverse=True)]
+
+    def remove(self, key):
+        """
+        This method removes an entry.
+        params: key
+        returns: None
+        """
+        for path in self.paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        """
+        This method removes the least recently used entries above max_entries, or while the entries take more than
+        max_bytes.
+        params: None
+        returns: None
+        """
+        entries = self.entries()
+        total = sum(size for _, size in entries)
+        for rank in range(len(entries) - 1, -1, -1):
+            if rank < self.max_entries and total <= self.max_bytes:
+                break
+            key, size = entries[rank]
+            self.remove(key)
+            total -= size
+
+    def clear(self):
+        """
+        This method invalidates the whole cache.
+        params: None
+        returns: number of entries removed
+        """
+        entries = self.entries()
+        for key, _ in entries:
+            self.remove(key)
+        return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the cache of the model search results')
+    parser.add_argument('command', choices=['list', 'clear'])
+    parser.add_argument('--directory', default='Training_Search_Cache')
+    args = parser.parse_args()
+    cache = SearchCache(args.directory)
+    if args.command == 'clear':
+        print('%s entries removed' % cache.clear())
+    else:
+        for key, size in cache.entries():
+            print('%s %s' % (key, size))
+
+
+if __name__ == '__main__':
+    main()
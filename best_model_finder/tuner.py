@@ -1,7 +1,18 @@
+import time
+import numpy as np
+from joblib import Parallel, delayed, cpu_count
+from sklearn.base import clone
 from sklearn.naive_bayes import GaussianNB
-from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import ParameterGrid, ParameterSampler
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import roc_auc_score, accuracy_score
+from best_model_finder.fold_plan import FoldPlan
+
+# random forest configurations searched, whatever the search strategy
+RF_PARAM_GRID = {'n_estimators': [200, 400, 500], 'max_features': ['auto', 'sqrt', 'log2'],
+                 'max_depth': [3, 4, 6, 7], 'criterion': ['gini', 'entropy']}
+# naive bayes configurations searched
+NB_PARAM_GRID = {"var_smoothing": [1e-9, 0.1, 0.001, 0.5, 0.05, 0.01, 1e-8, 1e-7, 1e-6, 1e-10, 1e-11]}
 
 
 class ModelFinder:
@@ -9,106 +20,283 @@ class ModelFinder:
     This class is used to find the model with the best accuracy and AUC score.
     """
 
-    def __init__(self, file_object, logger_object):
+    def __init__(self, file_object, logger_object, n_jobs=1, tree_jobs=1, verbose=0, search_strategy='grid',
+                 max_fits=60, time_budget=None, halving_factor=3, search_cache=None):
         # self.var_smoothing = None
         # self.grid = None
         # self.param_grid = None
         self.file_object = file_object
         self.logger_object = logger_object
+        # cores of the searches: the cross validation fits run in cv_jobs processes, each forest on tree_jobs cores
+        self.cv_jobs, self.tree_jobs = self.split_jobs(n_jobs, tree_jobs)
+        self.verbose = verbose
+        # random forest search: 'grid' (every configuration), 'halving' (successive halving over n_estimators) or
+        # 'random' (random configurations until max_fits cross validation fits or time_budget seconds are used)
+        if search_strategy not in ('grid', 'halving', 'random'):
+            raise ValueError('Unknown search strategy %s' % search_strategy)
+        self.search_strategy = search_strategy
+        self.max_fits = max_fits
+        self.time_budget = time_budget
+        self.halving_factor = halving_factor
+        self.search_cache = search_cache  # SearchCache reusing the results of unchanged searches, None to disable
+        self.rf_best_params = None
+        self.nb_best_params = None
+        self.scores = None  # test scores of the best model of every family
         self.gnb = GaussianNB()
-        self.rfc = RandomForestClassifier(random_state=41)
+        self.rfc = RandomForestClassifier(random_state=41, n_jobs=self.tree_jobs)
+
+    @staticmethod
+    def split_jobs(n_jobs, tree_jobs=1):
+        """
+        Split the cores between the cross validation layer and the trees of the forests, so that the two layers
+        together don't use more cores than n_jobs.
+        params: n_jobs (total number of cores, -1 for all the cores), tree_jobs (cores of each forest)
+        returns: cv_jobs, tree_jobs
+        """
+        if n_jobs is None or n_jobs < 0:
+            n_jobs = cpu_count()
+        tree_jobs = max(1, min(tree_jobs, n_jobs))
+        return max(1, n_jobs // tree_jobs), tree_jobs
 
-    def get_best_params_for_naive_bayes(self, train_x, train_y):
+    def get_best_params_for_naive_bayes(self, train_x, train_y, fold_plan=None):
         """
         Gets the parameters for the Naive Bayes's Algorithm which gives the best accuracy. Hyperparameter Tuning is
         used.
-        params: train_x, train_y
-        First we initialize self.params_grid which is a dictionary of parameters names as keys and lists of parameter
-        settings to try as values --> next we create an object of the GridSearchCv class to find the best parameters -->
-        next use grifit on the training dataset to get the best parameters for the gnb model --> next extract the best
-        parameters into 'self.var_smoothing' --> create a new model using the gnb algorithm with the best parameters.
+        params: train_x, train_y, fold_plan (cross validation folds shared with the random forest search)
+        Get the per-class statistics of every fold from the fold plan --> compute the validation accuracy of every
+        variance smoothing of NB_PARAM_GRID on every fold from these statistics, without fitting a model per value
+        and fold --> extract the best parameters, the first one with the best mean accuracy like the grid search -->
+        create a new model using the gnb algorithm with the best parameters.
         returns: self.gnb --> Gaussian Naive Bayes model with the best parameters
         """
         self.logger_object.log(self.file_object,
                                'Entered the get_best_params_for_naive_bayes method of the Model_Finder class')
-        # initializing with different combination of parameters
-        param_grid = {"var_smoothing": [1e-9, 0.1, 0.001, 0.5, 0.05, 0.01, 1e-8, 1e-7, 1e-6, 1e-10, 1e-11]}
-        # Creating an object of the Grid Search class
-        grid = GridSearchCV(estimator=self.gnb, param_grid=param_grid, cv=3, verbose=3)
-        # finding the best parameters
-        grid.fit(train_x, train_y)
+        if fold_plan is None:
+            fold_plan = FoldPlan(train_x, train_y)
+        var_smoothing_values = NB_PARAM_GRID['var_smoothing']
+        mean_scores = fold_plan.naive_bayes_scores(var_smoothing_values).mean(axis=1)
         # extracting the best parameters
-        var_smoothing = grid.best_params_['var_smoothing']
+        best = int(np.argmax(mean_scores))
+        self.nb_best_params = {'var_smoothing': var_smoothing_values[best]}
         # creating a new model with the best parameters
-        self.gnb = GaussianNB(var_smoothing=var_smoothing)
+        self.gnb = GaussianNB(**self.nb_best_params)
         # training the mew model with the best parameters on the training dataset
         self.gnb.fit(train_x, train_y)
-        self.logger_object.log(self.file_object, 'Naive Bayes best params: ' + str(grid.best_params_) +
+        self.logger_object.log(self.file_object, 'Naive Bayes cross validation accuracy: ' +
+                               str(round(mean_scores[best], 4)))
+        self.logger_object.log(self.file_object, 'Naive Bayes best params: ' + str(self.nb_best_params) +
                                '. Exited the get_best_params_for_naive_bayes method of the Model_Finder class')
         return self.gnb
 
-    def get_best_params_for_rf(self, train_x, train_y):
+    def cross_validate_candidates(self, fold_plan, candidates):
+        """
+        Cross validate random forest configurations, the configurations running in parallel processes.
+        params: fold_plan, candidates (list of parameter dictionaries)
+        returns: mean accuracy of every candidate, -inf for the candidates which failed
+        """
+        means = Parallel(n_jobs=self.cv_jobs, verbose=self.verbose)(
+            delayed(self.mean_cv_score)(clone(self.rfc).set_params(**params), fold_plan) for params in candidates)
+        return np.array(means)
+
+    @staticmethod
+    def mean_cv_score(estimator, fold_plan):
+        """
+        Cross validate one configuration on the folds of the fold plan.
+        params: estimator, fold_plan
+        returns: mean accuracy over the folds, -inf when the configuration can't be fitted (like the error score of
+        the grid search, a failed configuration is never chosen)
+        """
+        scores = list()
+        for k in range(fold_plan.n_splits):
+            fold_train_x, fold_train_y, fold_test_x, fold_test_y = fold_plan.fold_data(k)
+            try:
+                scores.append(clone(estimator).fit(fold_train_x, fold_train_y).score(fold_test_x, fold_test_y))
+            except ValueError:
+                return -np.inf
+        return np.mean(scores)
+
+    def successive_halving_rf(self, fold_plan):
+        """
+        Search the random forest configurations with successive halving, n_estimators being the resource.
+        params: fold_plan
+        Cross validate all the configurations with few trees --> keep the best 1 / halving_factor of them -->
+        multiply the trees by halving_factor --> repeat until the last round, run with the largest n_estimators of
+        the grid, keeps the best configuration.
+        returns: best_params, number of fits, number of trees fitted
+        """
+        max_trees = max(RF_PARAM_GRID['n_estimators'])
+        candidates = list(ParameterGrid({k: v for k, v in RF_PARAM_GRID.items() if k != 'n_estimators'}))
+        rounds = max(1, int(np.ceil(np.log(len(candidates)) / np.log(self.halving_factor))))
+        fits = trees = 0
+        for i in range(rounds):
+            n_trees = max(1, int(max_trees / self.halving_factor ** (rounds - 1 - i)))
+            round_candidates = [dict(params, n_estimators=n_trees) for params in candidates]
+            means = self.cross_validate_candidates(fold_plan, round_candidates)
+            fits += fold_plan.n_splits * len(candidates)
+            trees += fold_plan.n_splits * len(candidates) * n_trees
+            keep = max(1, int(np.ceil(len(candidates) / self.halving_factor)))
+            candidates = [candidates[j] for j in np.argsort(-means, kind='stable')[:keep]]
+        return dict(candidates[0], n_estimators=max_trees), fits, trees
+
+    def random_search_rf(self, fold_plan):
+        """
+        Search random configurations of the random forest grid within a budget.
+        params: fold_plan
+        Sample max_fits / folds configurations of the grid --> cross validate them in batches of cv_jobs
+        configurations --> stop when the configurations are done or when time_budget seconds are spent.
+        returns: best_params, number of fits, number of trees fitted
+        """
+        n_candidates = max(1, min(len(ParameterGrid(RF_PARAM_GRID)), self.max_fits // fold_plan.n_splits))
+        candidates = list(ParameterSampler(RF_PARAM_GRID, n_iter=n_candidates, random_state=42))
+        start = time.time()
+        evaluated, means = list(), list()
+        for batch_start in range(0, len(candidates), self.cv_jobs):
+            batch = candidates[batch_start:batch_start + self.cv_jobs]
+            means.extend(self.cross_validate_candidates(fold_plan, batch))
+            evaluated.extend(batch)
+            if self.time_budget is not None and time.time() - start > self.time_budget:
+                break
+        fits = fold_plan.n_splits * len(evaluated)
+        trees = fold_plan.n_splits * sum(params['n_estimators'] for params in evaluated)
+        return evaluated[int(np.argmax(means))], fits, trees
+
+    def get_best_params_for_rf(self, train_x, train_y, fold_plan=None):
         """
         Gets the parameters for the random forest classifier Algorithm which gives the best accuracy. Hyperparameter
         tuning is used.
-        params: train_x, train_y
-        First we initialize param_grid_rfc which is a dictionary of parameters names as keys and lists of parameter
-        settings to try as values --> next we create an object of the GridSearchCv class to find the best parameters -->
-        next use fit on the training dataset to get the best parameters for the xgb model --> next extract the best
-        parameters into 'self.var_smoothing' --> create a new model using the gnb algorithm with the best parameters.
+        params: train_x, train_y, fold_plan (cross validation folds shared with the naive bayes search)
+        Search the configurations of the RF_PARAM_GRID on the folds of the fold plan with the search strategy: the
+        whole grid, successive halving or a budgeted random search --> extract the best parameters -->
+        log the best parameters and the budget used --> create a new model using the random forest algorithm with the
+        best parameters.
         returns: self.rfc --> rfc model with the best parameters
         """
         self.logger_object.log(self.file_object,
                                'Entered the get_best_params_for_rfc method of the Model_Finder class')
-        # initializing with different combination of parameters
-        param_grid_rfc = {'n_estimators': [200, 400, 500], 'max_features': ['auto', 'sqrt', 'log2'],
-                          'max_depth': [3, 4, 6, 7], 'criterion': ['gini', 'entropy']}
-        # Creating an object of the Grid Search class
-        cv_rfc = GridSearchCV(estimator=self.rfc, param_grid=param_grid_rfc, cv=5)
-        cv_rfc.fit(train_x, train_y)
+        if fold_plan is None:
+            fold_plan = FoldPlan(train_x, train_y)
+        start = time.time()
+        if self.search_strategy == 'halving':
+            best_params, fits, trees = self.successive_halving_rf(fold_plan)
+        elif self.search_strategy == 'random':
+            best_params, fits, trees = self.random_search_rf(fold_plan)
+        else:
+            # every configuration of the grid, in the order of the grid search, on the fold data sliced once by the
+            # fold plan: the first one with the best mean accuracy is the one the grid search would choose
+            candidates = list(ParameterGrid(RF_PARAM_GRID))
+            best_params = candidates[int(np.argmax(self.cross_validate_candidates(fold_plan, candidates)))]
+            fits = fold_plan.n_splits * len(candidates)
+            trees = fold_plan.n_splits * sum(params['n_estimators'] for params in candidates)
         # extracting the best parameters
-        n_estimators = cv_rfc.best_params_['n_estimators']
-        max_features = cv_rfc.best_params_['max_features']
-        max_depth = cv_rfc.best_params_['max_depth']
-        criterion = cv_rfc.best_params_['criterion']
-        # creating a new model with the best parameters
+        self.rf_best_params = best_params
+        n_estimators = best_params['n_estimators']
+        max_features = best_params['max_features']
+        max_depth = best_params['max_depth']
+        criterion = best_params['criterion']
+        # creating a new model with the best parameters, the cross validation cores are free for its trees
         self.rfc = RandomForestClassifier(n_estimators=n_estimators, criterion=criterion, max_depth=max_depth,
-                                          max_features=max_features, random_state=42)
+                                          max_features=max_features, random_state=42,
+                                          n_jobs=self.cv_jobs * self.tree_jobs)
         # training the mew model
         self.rfc.fit(train_x, train_y)
-        self.logger_object.log(self.file_object, 'rfc best params: ' + str(cv_rfc.best_params_) +
+        self.for_serving(self.rfc)
+        self.logger_object.log(self.file_object, 'rfc ' + self.search_strategy + ' search used ' + str(fits) +
+                               ' fits, ' + str(trees) + ' trees in ' + str(round(time.time() - start, 1)) + ' seconds')
+        self.logger_object.log(self.file_object, 'rfc best params: ' + str(best_params) +
                                '. Exited the get_best_params_for_rfc method of the Model_Finder class')
         return self.rfc
 
+    def search_settings(self):
+        """
+        Get the settings which change the result of the searches, they are part of the search cache key.
+        params: None
+        returns: settings dictionary
+        """
+        return {'rf_grid': RF_PARAM_GRID, 'nb_grid': NB_PARAM_GRID, 'search_strategy': self.search_strategy,
+                'max_fits': self.max_fits, 'time_budget': self.time_budget, 'halving_factor': self.halving_factor}
+
+    @staticmethod
+    def for_serving(model):
+        """
+        Make a fitted model predict on a single core. The n_jobs of a forest is saved with it, so every prediction
+        request of every worker would otherwise start a pool of threads and sum the trees in a varying order.
+        params: model
+        returns: model
+        """
+        if 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=1)
+        return model
+
+    def build_model(self, model_name, params):
+        """
+        Create the final model of a family with the given parameters.
+        params: model_name ('RFC' or 'NaiveBayes'), params
+        returns: model, not fitted
+        """
+        if model_name == 'RFC':
+            return RandomForestClassifier(random_state=42, n_jobs=self.cv_jobs * self.tree_jobs, **params)
+        return GaussianNB(**params)
+
     def get_best_model(self, train_x, train_y, test_x, test_y):
         """
         Get the best model to use for prediction.
         params: train_x, train_y, test_x, test_y
-        Get the xgboost model --> predict the test data --> if there is only one label in y, then roc_auc_score returns
-        an error. We will use accuracy in that case else we use roc_auc score --> repeat the same with the naive bayes
-        model. Check which score is higher and return that model.
+        Look the data up in the search cache --> if the search was done on the same data and settings, return the
+        cached model, or refit it from the cached parameters --> else search the models and store the result.
         returns: 'model_name', model object
         """
         self.logger_object.log(self.file_object, 'Entered the get_best_model method of the Model_Finder class')
+        if self.search_cache is None:
+            return self.search_best_model(train_x, train_y, test_x, test_y)
+        key = self.search_cache.fingerprint([train_x, train_y, test_x, test_y], self.search_settings())
+        result, model = self.search_cache.get(key)
+        if result is not None:
+            if model is None:  # only the parameters could be read, refit the final model
+                model = self.build_model(result['model_name'], result['params'][result['model_name']])
+                model.fit(train_x, train_y)
+            self.for_serving(model)  # also for the models cached before they were stored single core
+            self.logger_object.log(self.file_object, 'Search result found in the cache for ' + key[:12] + ': ' +
+                                   result['model_name'] + ' ' + str(result['params'][result['model_name']]) +
+                                   ', scores ' + str(result['scores']))
+            return result['model_name'], model
+        model_name, model = self.search_best_model(train_x, train_y, test_x, test_y)
+        result = {'model_name': model_name, 'params': {'RFC': self.rf_best_params, 'NaiveBayes': self.nb_best_params},
+                  'scores': self.scores}
+        self.search_cache.put(key, result, model)
+        return model_name, model
+
+    def search_best_model(self, train_x, train_y, test_x, test_y):
+        """
+        Search the best model of every family and compare them.
+        params: train_x, train_y, test_x, test_y
+        Split the training data into the cross validation folds shared by the searches --> get the random forest model
+        --> predict the test data --> if there is only one label in y, then roc_auc_score returns an error. We will use
+        accuracy in that case else we use roc_auc score --> repeat the same with the naive bayes model. Check which
+        score is higher and return that model.
+        returns: 'model_name', model object
+        """
+        # one fold plan for both model families, so they are searched on identical folds
+        fold_plan = FoldPlan(train_x, train_y)
         # create best model for rfc
-        rfc = self.get_best_params_for_rf(train_x, train_y)
+        rfc = self.get_best_params_for_rf(train_x, train_y, fold_plan)
         prediction_rfc = rfc.predict(test_x)  # Predictions using the rfc Model
         # if there is only one label in y, then roc_auc_score returns error. We will use accuracy in that case
-        if len(test_y.unique()) == 1:
+        if len(np.unique(test_y)) == 1:
             rfc_score = accuracy_score(test_y, prediction_rfc)
             self.logger_object.log(self.file_object, 'Accuracy for XGBoost:' + str(rfc_score))
         else:
             rfc_score = roc_auc_score(test_y, prediction_rfc)
             self.logger_object.log(self.file_object, 'AUC for rfc:' + str(rfc_score))
         # create best model for naive bayes
-        naive_bayes = self.get_best_params_for_naive_bayes(train_x, train_y)
+        naive_bayes = self.get_best_params_for_naive_bayes(train_x, train_y, fold_plan)
         prediction_naive_bayes = naive_bayes.predict(test_x)
-        if len(test_y.unique()) == 1:
+        if len(np.unique(test_y)) == 1:
             naive_bayes_score = accuracy_score(test_y, prediction_naive_bayes)
             self.logger_object.log(self.file_object, 'Accuracy for NB:' + str(naive_bayes_score))
         else:
             naive_bayes_score = roc_auc_score(test_y, prediction_naive_bayes)
             self.logger_object.log(self.file_object, 'AUC for NB:' + str(naive_bayes_score))
+        self.scores = {'RFC': rfc_score, 'NaiveBayes': naive_bayes_score}
         # comparing the two models
         if naive_bayes_score < rfc_score:
             return 'RFC', rfc
@@ -0,0 +1,84 @@
+"""
+Check that FlatForest predicts exactly what the sklearn random forest predicts, on fixed seed forests: deep, shallow,
+best first, multiclass and forests with single node trees, each compiled from the sklearn forest and loaded from the
+array format the predictions use. Exits with status 1 on a difference. Run from the project directory:
+
+    python checks/flat_forest_check.py
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_operations.array_artifact import ArrayArtifact  # noqa: E402
+from model_inference.flat_forest import FlatForest  # noqa: E402
+
+
+def fixed_seed_forests(seed):
+    """
+    This function trains the forests of the check.
+    params: seed
+    returns: list of (name, forest, training features)
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    random_state = np.random.RandomState(seed)
+    x = random_state.randn(3000, 23)
+    y = (x[:, 0] + x[:, 1] * x[:, 2] + random_state.randn(3000) > 0.5).astype(int)
+    y3 = np.digitize(x[:, 0] + random_state.randn(3000), [-0.5, 0.5])
+    # 12 rows with a single positive one: the bootstrap samples without it grow single node trees
+    few_x, few_y = x[:12], np.array([1] + [0] * 11)
+    return [('deep', RandomForestClassifier(50, random_state=seed).fit(x, y), x),
+            ('shallow', RandomForestClassifier(100, max_depth=3, random_state=seed).fit(x, y), x),
+            ('best first', RandomForestClassifier(50, max_leaf_nodes=20, random_state=seed).fit(x, y), x),
+            ('multiclass', RandomForestClassifier(50, max_depth=7, random_state=seed).fit(x, y3), x),
+            ('single node trees', RandomForestClassifier(50, random_state=seed).fit(few_x, few_y), few_x),
+            ('all single node', RandomForestClassifier(10, min_samples_split=10 ** 6, random_state=seed).fit(x, y), x)]
+
+
+def compare(name, model, flat_forest, x):
+    """
+    This function compares the predictions of a forest and of its FlatForest.
+    params: name, model, flat_forest, x
+    returns: list of differences
+    """
+    x = x.astype(np.float32)
+    expected_proba, proba = model.predict_proba(x), flat_forest.predict_proba(x)
+    if not np.array_equal(expected_proba, proba):
+        return ['%s: largest probability difference %s' % (name, np.abs(expected_proba - proba).max())]
+    if not np.array_equal(model.predict(x), flat_forest.predict(x)):
+        return ['%s: different classes' % name]
+    return list()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check FlatForest against the sklearn random forest')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rows', type=int, default=5000)
+    args = parser.parse_args()
+    differences = list()
+    directory = tempfile.mkdtemp(prefix='flat_forest_check_')
+    try:
+        for k, (name, model, train_x) in enumerate(fixed_seed_forests(args.seed)):
+            # random rows, and the training rows whose values fall on the thresholds
+            x = np.vstack([np.random.RandomState(args.seed + 1).randn(args.rows, train_x.shape[1]), train_x])
+            single_node_trees = sum(estimator.tree_.node_count == 1 for estimator in model.estimators_)
+            differences += compare(name + ' compiled', model, FlatForest.compile(model), x)
+            ArrayArtifact.save(model, os.path.join(directory, str(k)))
+            loaded = ArrayArtifact.load(os.path.join(directory, str(k)))
+            differences += compare(name + ' array format', model, FlatForest.for_model(loaded), x)
+            print('%-18s %3s trees, %2s single node, %s rows' % (name, len(model.estimators_), single_node_trees,
+                                                                  len(x)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    for difference in differences:
+        print('DIFFERENCE ' + difference)
+    print('identical' if not differences else '%s differences' % len(differences))
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == '__main__':
+    main()
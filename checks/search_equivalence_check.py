@@ -0,0 +1,118 @@
+"""
+Check that the searches of ModelFinder choose what the sklearn searches they replace choose, on a fixed seed dataset:
+the naive bayes scores computed from the class statistics of the folds against GaussianNB fitted on every fold, and
+the grid strategy of the random forest against GridSearchCV. Exits with status 1 on a difference. Run from the
+project directory:
+
+    python checks/search_equivalence_check.py
+    python checks/search_equivalence_check.py --full-grid --n-jobs -1
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from application_logging.logger import AppLogger  # noqa: E402
+from best_model_finder import tuner  # noqa: E402
+from best_model_finder.fold_plan import FoldPlan  # noqa: E402
+
+# a grid with the keys of RF_PARAM_GRID, small enough to be searched twice in seconds
+SMALL_RF_PARAM_GRID = {'n_estimators': [10, 20], 'max_features': ['sqrt', 'log2'], 'max_depth': [2, 4],
+                       'criterion': ['gini', 'entropy']}
+
+
+def cluster_like_data(rows, seed):
+    """
+    This function generates a fixed seed dataset shaped like the training data of a cluster.
+    params: rows, seed
+    returns: features, labels
+    """
+    from sklearn.datasets import make_classification
+    return make_classification(n_samples=rows, n_features=23, n_informative=8, weights=[0.78], flip_y=0.05,
+                               random_state=seed)
+
+
+def check_naive_bayes(fold_plan, model_finder):
+    """
+    This function compares the naive bayes search with GaussianNB fitted on every fold and with GridSearchCV.
+    params: fold_plan, model_finder
+    For every variance smoothing and fold: the accuracy, the class probabilities and their AUC against the ones of
+    GaussianNB --> the chosen variance smoothing against the one of GridSearchCV.
+    returns: list of differences
+    """
+    from scipy.special import logsumexp
+    from sklearn.metrics import roc_auc_score
+    from sklearn.model_selection import GridSearchCV
+    from sklearn.naive_bayes import GaussianNB
+    differences = list()
+    var_smoothing_values = tuner.NB_PARAM_GRID['var_smoothing']
+    scores = fold_plan.naive_bayes_scores(var_smoothing_values)
+    for k in range(fold_plan.n_splits):
+        fold_train_x, fold_train_y, fold_test_x, fold_test_y = fold_plan.fold_data(k)
+        for i, var_smoothing in enumerate(var_smoothing_values):
+            model = GaussianNB(var_smoothing=var_smoothing).fit(fold_train_x, fold_train_y)
+            _, joint_log_likelihood = fold_plan.naive_bayes_joint_log_likelihood(k, var_smoothing)
+            proba = np.exp(joint_log_likelihood - logsumexp(joint_log_likelihood, axis=1)[:, np.newaxis])
+            expected_proba = model.predict_proba(fold_test_x)
+            auc = roc_auc_score(fold_test_y, proba[:, 1])
+            expected_auc = roc_auc_score(fold_test_y, expected_proba[:, 1])
+            expected_accuracy = model.score(fold_test_x, fold_test_y)
+            if scores[i, k] != expected_accuracy or not np.allclose(proba, expected_proba) or \
+                    not np.isclose(auc, expected_auc):
+                differences.append('naive bayes var_smoothing %s fold %s: accuracy %s / %s, AUC %s / %s'
+                                   % (var_smoothing, k, scores[i, k], expected_accuracy, auc, expected_auc))
+    chosen = model_finder.get_best_params_for_naive_bayes(fold_plan.train_x, fold_plan.train_y, fold_plan)
+    grid_search = GridSearchCV(GaussianNB(), tuner.NB_PARAM_GRID, cv=fold_plan.folds)
+    grid_search.fit(fold_plan.train_x, fold_plan.train_y)
+    if model_finder.nb_best_params != grid_search.best_params_:
+        differences.append('naive bayes best params %s, GridSearchCV %s' % (model_finder.nb_best_params,
+                                                                            grid_search.best_params_))
+    print('naive bayes: %s values on %s folds, best %s' % (len(var_smoothing_values), fold_plan.n_splits,
+                                                           chosen.get_params()['var_smoothing']))
+    return differences
+
+
+def check_grid(fold_plan, model_finder):
+    """
+    This function compares the grid strategy of the random forest search with GridSearchCV on the same folds.
+    params: fold_plan, model_finder
+    returns: list of differences
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import GridSearchCV
+    model_finder.get_best_params_for_rf(fold_plan.train_x, fold_plan.train_y, fold_plan)
+    grid_search = GridSearchCV(RandomForestClassifier(random_state=41), tuner.RF_PARAM_GRID, cv=fold_plan.folds,
+                               n_jobs=model_finder.cv_jobs)
+    grid_search.fit(fold_plan.train_x, fold_plan.train_y)
+    print('random forest grid: %s configurations, best %s' % (len(grid_search.cv_results_['params']),
+                                                             model_finder.rf_best_params))
+    if model_finder.rf_best_params != grid_search.best_params_:
+        return ['random forest best params %s, GridSearchCV %s' % (model_finder.rf_best_params,
+                                                                   grid_search.best_params_)]
+    return list()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the searches of ModelFinder against the sklearn ones')
+    parser.add_argument('--rows', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--full-grid', action='store_true', help='search the RF_PARAM_GRID itself, takes minutes')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    args = parser.parse_args()
+    if not args.full_grid:
+        tuner.RF_PARAM_GRID = SMALL_RF_PARAM_GRID
+    x, y = cluster_like_data(args.rows, args.seed)
+    fold_plan = FoldPlan(x, y)
+    with open(os.devnull, 'a') as log_file:
+        model_finder = tuner.ModelFinder(log_file, AppLogger(), n_jobs=args.n_jobs)
+        differences = check_naive_bayes(fold_plan, model_finder) + check_grid(fold_plan, model_finder)
+    for difference in differences:
+        print('DIFFERENCE ' + difference)
+    print('identical' if not differences else '%s differences' % len(differences))
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == '__main__':
+    main()
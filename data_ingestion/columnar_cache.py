@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+from data_ingestion.dtype_plan import DtypePlan
+
+
+class ColumnarCache:
+    """
+    This class stores the good data table in a compact columnar binary format: one .npy file per column, in the
+    smallest integer type holding the values of the column, plus a boolean .npy mask for the columns with missing
+    values, described by a meta.json file. The loaders memory-map the files and only read the columns they need.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, 'meta.json')
+
+    @staticmethod
+    def storage_type(column_type, minimum, maximum):
+        """
+        This method chooses the numpy type a column is stored with.
+        params: column_type (declared SQL type), minimum, maximum
+        Integer columns get the smallest integer type holding their minimum and maximum, the others float64.
+        returns: numpy type
+        """
+        if 'INT' not in column_type.upper():
+            return np.float64
+        return DtypePlan.smallest_integer_type(minimum, maximum)
+
+    @staticmethod
+    def new_column_file(path, dtype, row_count):
+        """
+        This method creates a .npy file for a column and returns it memory-mapped for writing.
+        params: path, dtype, row_count
+        returns: array
+        """
+        if row_count == 0:  # an empty file can't be memory-mapped
+            np.save(path, np.empty(0, dtype=dtype))
+            return np.empty(0, dtype=dtype)
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(row_count,))
+
+    def write_from_database(self, database_path, batch_size=100000):
+        """
+        This method writes the Good_Raw_Data table of the database to the cache.
+        params: database_path, batch_size
+        Get the columns and their declared types --> get the row count and the minimum, maximum and non-null count of
+        every column in one query --> choose the storage type of every column --> stream the rows in batches into
+        memory-mapped .npy files in a temporary directory --> write the meta file --> swap the temporary directory
+        with the cache directory.
+        returns: None
+        """
+        conn = sqlite3.connect(database_path)
+        try:
+            table_info = conn.execute('PRAGMA table_info(Good_Raw_Data)').fetchall()
+            columns = [column[1] for column in table_info]
+            column_types = [column[2] for column in table_info]
+            aggregates = ', '.join('MIN("{0}"), MAX("{0}"), COUNT("{0}")'.format(c) for c in columns)
+            stats = conn.execute('SELECT count(*), %s FROM Good_Raw_Data' % aggregates).fetchone()
+            row_count = stats[0]
+            temporary_directory = self.directory.rstrip('/') + '.tmp'
+            if os.path.isdir(temporary_directory):
+                shutil.rmtree(temporary_directory)
+            os.makedirs(temporary_directory)
+            meta = {'row_count': row_count, 'columns': list()}
+            values, masks = list(), list()
+            for i, (column, column_type) in enumerate(zip(columns, column_types)):
+                minimum, maximum, non_null = stats[1 + 3 * i: 4 + 3 * i]
+                dtype = self.storage_type(column_type, minimum, maximum)
+                entry = {'name': column, 'file': 'column_%s.npy' % i, 'dtype': np.dtype(dtype).name, 'mask': None}
+                values.append(self.new_column_file(os.path.join(temporary_directory, entry['file']), dtype, row_count))
+                if non_null < row_count:
+                    entry['mask'] = 'column_%s_missing.npy' % i
+                    masks.append(self.new_column_file(os.path.join(temporary_directory, entry['mask']), np.bool_,
+                                                      row_count))
+                else:
+                    masks.append(None)
+                meta['columns'].append(entry)
+            cursor = conn.execute('SELECT %s FROM Good_Raw_Data' % ', '.join('"%s"' % c for c in columns))
+            start = 0
+            rows = cursor.fetchmany(batch_size)
+            while rows and start < row_count:
+                rows = rows[:row_count - start]
+                block = np.array(rows, dtype=np.float64)  # NULL becomes NaN
+                end = start + len(rows)
+                for i in range(len(columns)):
+                    column = block[:, i]
+                    if masks[i] is not None:
+                        missing = np.isnan(column)
+                        masks[i][start:end] = missing
+                        column = np.where(missing, 0, column)
+                    values[i][start:end] = column
+                start = end
+                rows = cursor.fetchmany(batch_size)
+        finally:
+            conn.close()
+        for array in values + [mask for mask in masks if mask is not None]:
+            if isinstance(array, np.memmap):
+                array.flush()
+        del values, masks
+        with open(os.path.join(temporary_directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        # swap the new cache in place of the old one
+        old_directory = self.directory.rstrip('/') + '.old'
+        if os.path.isdir(old_directory):  # left by a run which stopped during the swap, the rename would fail
+            shutil.rmtree(old_directory)
+        if os.path.isdir(self.directory):
+            os.rename(self.directory, old_directory)
+        os.rename(temporary_directory, self.directory)
+        if os.path.isdir(old_directory):
+            shutil.rmtree(old_directory)
+
+    def is_fresh(self, database_path):
+        """
+        This method checks whether the cache exists and is newer than the database.
+        params: database_path
+        returns: True if the cache can be used, False otherwise
+        """
+        if not os.path.isfile(self.meta_path) or not os.path.isfile(database_path):
+            return False
+        return os.path.getmtime(self.meta_path) >= os.path.getmtime(database_path)
+
+    def read_meta(self):
+        """
+        This method reads the description of the cached columns.
+        params: None
+        returns: meta dictionary
+        """
+        with open(self.meta_path, 'r') as f:
+            return json.load(f)
+
+    def load(self, columns=None, compact=False):
+        """
+        This method loads the cached columns into a dataframe.
+        params: columns (names of the columns to read, all the columns when None), compact
+        Read the meta file --> memory-map the files of the requested columns --> when compact, the columns keep their
+        small stored integer type (nullable when values are missing) --> else Integer columns are returned as int64,
+        or as float64 with NaN for the missing values, like pandas.read_csv would load them.
+        returns: data
+        """
+        meta = self.read_meta()
+        entries = {entry['name']: entry for entry in meta['columns']}
+        if columns is None:
+            columns = [entry['name'] for entry in meta['columns']]
+        data = dict()
+        for column in columns:
+            entry = entries[column]
+            values = np.load(os.path.join(self.directory, entry['file']), mmap_mode='r')
+            missing = None
+            if entry['mask'] is not None:
+                missing = np.load(os.path.join(self.directory, entry['mask']), mmap_mode='r')
+            if compact and values.dtype.kind == 'i':
+                values = DtypePlan.integer_column(values, missing, values.dtype)
+            elif missing is not None:
+                values = values.astype(np.float64)
+                values[missing] = np.nan
+            elif values.dtype.kind == 'i':
+                values = values.astype(np.int64)
+            else:
+                values = np.array(values)
+            data[column] = values
+        return pd.DataFrame(data, columns=columns)
@@ -1,4 +1,7 @@
 import pandas as pd
+from data_ingestion.db_reader import GoodDataReader
+from data_ingestion.columnar_cache import ColumnarCache
+from data_ingestion.dtype_plan import DtypePlan
 
 
 class DataGetterPred:
@@ -6,7 +9,14 @@ class DataGetterPred:
     This class is used for obtaining the data from the source for prediction.
     """
 
-    def __init__(self, file_object, logger_object):
+    def __init__(self, file_object, logger_object, source='csv', compact_dtypes=False):
+        # 'csv' reads the exported csv file, 'database' reads the table of the database, 'cache' reads the columnar
+        # cache and 'auto' reads the cache when it is newer than the database, else the database
+        self.source = source
+        self.compact_dtypes = compact_dtypes  # keep the columns in the small dtypes planned from the schema
+        self.cache = ColumnarCache('Prediction_FileFromDB/columns')
+        self.database = 'Prediction_Database/Prediction.db'
+        self.schema_path = 'schema_prediction.json'
         self.prediction_file = 'Prediction_FileFromDB/InputFile.csv'
         self.file_object = file_object
         self.logger_object = logger_object
@@ -15,11 +25,25 @@ class DataGetterPred:
         """
         This method reads the csv file of prediction data from the database and returns a pandas dataframe of the data.
         params: None
-        Get the csv file and load it into a pandas dataframe --> return file.
+        Get the csv file and load it into a pandas dataframe, or load the columnar cache, or read the table of the
+        database directly, depending on the source --> convert the columns to the compact dtypes planned from the
+        schema if asked --> return file.
         returns: data
         """
         self.logger_object.log(self.file_object, 'Entered the get_data method of the DataGetter class')
-        data = pd.read_csv(self.prediction_file)  # reading the data file
+        source = self.source
+        if source == 'auto':
+            source = 'cache' if self.cache.is_fresh(self.database) else 'database'
+        if source == 'cache':
+            # memory-mapped columns of the columnar cache, already stored in their small integer types
+            data = self.cache.load(compact=self.compact_dtypes)
+        elif source == 'database':
+            # read the table straight from the database with the column types of the schema
+            data = GoodDataReader(self.database, self.schema_path).read()
+        else:
+            data = pd.read_csv(self.prediction_file)  # reading the data file
+        if self.compact_dtypes and source != 'cache':
+            data = DtypePlan(self.schema_path).apply(data)
         self.logger_object.log(self.file_object,
                                'Data Load Successful.Exited the get_data method of the DataGetter class')
         return data
@@ -0,0 +1,69 @@
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# numpy types of the column types used in the schema files
+SCHEMA_TYPES = {'INTEGER': np.int64, 'INT': np.int64, 'FLOAT': np.float64, 'REAL': np.float64}
+
+
+class GoodDataReader:
+    """
+    This class reads the Good_Raw_Data table of a database straight into a pandas dataframe. The rows are fetched in
+    chunks into a preallocated numpy block and the column types are taken from the schema file, so there is no
+    intermediate csv file to write and parse and no type inference.
+    """
+
+    def __init__(self, database_path, schema_path, chunk_size=100000):
+        self.database_path = database_path
+        self.schema_path = schema_path
+        self.chunk_size = chunk_size
+
+    def column_types(self):
+        """
+        This method reads the names and the numpy types of the columns from the schema file.
+        params: None
+        returns: dictionary of column name --> numpy type
+        """
+        with open(self.schema_path, 'r') as f:
+            column_names = json.load(f)['ColName']
+        column_types = dict()
+        for column, column_type in column_names.items():
+            if column_type.upper() not in SCHEMA_TYPES:
+                raise ValueError('Unsupported type %s of the column %s' % (column_type, column))
+            column_types[column] = SCHEMA_TYPES[column_type.upper()]
+        return column_types
+
+    def read(self):
+        """
+        This method reads the whole table into a dataframe.
+        params: None
+        Get the column types from the schema --> count the rows of the table --> allocate a float block --> fetch the
+        rows chunk by chunk into the block (NULL becomes NaN) --> build the columns with their schema type; Integer
+        columns with missing values stay float so they can hold NaN, like pandas.read_csv would load them.
+        returns: data
+        """
+        column_types = self.column_types()
+        columns = list(column_types)
+        conn = sqlite3.connect(self.database_path)
+        try:
+            row_count = conn.execute('SELECT count(*) FROM Good_Raw_Data').fetchone()[0]
+            block = np.empty((row_count, len(columns)), dtype=np.float64)
+            cursor = conn.execute('SELECT %s FROM Good_Raw_Data' % ', '.join('"%s"' % c for c in columns))
+            start = 0
+            rows = cursor.fetchmany(self.chunk_size)
+            while rows and start < row_count:
+                rows = rows[:row_count - start]
+                block[start:start + len(rows)] = np.array(rows, dtype=np.float64)
+                start += len(rows)
+                rows = cursor.fetchmany(self.chunk_size)
+        finally:
+            conn.close()
+        block = block[:start]
+        data = dict()
+        for i, column in enumerate(columns):
+            values = block[:, i]
+            if column_types[column] is np.int64 and not np.isnan(values).any():
+                values = values.astype(np.int64)
+            data[column] = values
+        return pd.DataFrame(data, columns=columns)
@@ -0,0 +1,67 @@
+import json
+import numpy as np
+import pandas as pd
+
+# integer types tried, smallest first, when choosing the type of an Integer column
+INTEGER_TYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+class DtypePlan:
+    """
+    This class applies the compact dtypes planned from the column types of the schema file: Integer columns are kept
+    in the smallest integer type holding their values (a nullable pandas integer type when values are missing) and
+    Float columns in float32. This cuts the memory of the loaded data several times compared to int64/float64.
+    """
+
+    def __init__(self, schema_path):
+        with open(schema_path, 'r') as f:
+            column_names = json.load(f)['ColName']
+        self.column_types = {column: column_type.upper() for column, column_type in column_names.items()}
+
+    @staticmethod
+    def smallest_integer_type(minimum, maximum):
+        """
+        This method returns the smallest integer type holding the values between minimum and maximum.
+        params: minimum, maximum
+        returns: numpy type
+        """
+        for integer_type in INTEGER_TYPES:
+            info = np.iinfo(integer_type)
+            if minimum is None or (info.min <= minimum and maximum <= info.max):
+                return integer_type
+        return np.int64
+
+    @staticmethod
+    def integer_column(values, missing, integer_type):
+        """
+        This method builds an integer column, nullable if some values are missing.
+        params: values, missing (boolean mask of the missing values or None), integer_type
+        returns: array
+        """
+        if missing is None or not missing.any():
+            return values.astype(integer_type)
+        values = np.where(missing, 0, values).astype(integer_type)
+        return pd.arrays.IntegerArray(values, np.asarray(missing, dtype=bool))
+
+    def apply(self, data):
+        """
+        This method converts the columns of a dataframe to their planned dtypes.
+        params: data
+        Iterate over the columns of the schema present in the data --> Integer columns get the smallest integer type
+        holding their minimum and maximum --> Float columns get float32 --> the other columns are left as they are.
+        returns: data
+        """
+        compact = dict()
+        for column in data.columns:
+            column_type = self.column_types.get(column, '')
+            values = data[column].to_numpy()
+            if 'INT' in column_type and values.dtype.kind in 'if':
+                missing = np.isnan(values) if values.dtype.kind == 'f' else None
+                present = values[~missing] if missing is not None else values
+                minimum, maximum = (present.min(), present.max()) if len(present) else (None, None)
+                compact[column] = self.integer_column(values, missing, self.smallest_integer_type(minimum, maximum))
+            elif column_type in ('FLOAT', 'REAL') and values.dtype.kind in 'if':
+                compact[column] = values.astype(np.float32)
+            else:
+                compact[column] = data[column].values
+        return pd.DataFrame(compact, columns=data.columns, index=data.index)
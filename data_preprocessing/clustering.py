@@ -1,6 +1,8 @@
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from kneed import KneeLocator
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.model_selection import train_test_split
+from sklearn.utils import check_array
 from file_operations import file_methods
 
 
@@ -13,46 +15,125 @@ class KMeansClustering:
     def __init__(self, file_object, logger_object):
         self.file_object = file_object
         self.logger_object = logger_object
+        self.elbow_report = None  # knee and WCSS curve of the last elbow_plot
 
-    def elbow_plot(self, data):
+    @staticmethod
+    def wcss_for_k(data, n_clusters, minibatch=False):
         """
-        This method analyzes the data and returns an elbow plot diagram which displays the best number of clusters.
-        params: data
-        Loop over numbers 1 to 11 --> find the wcss --> plot the graph between wcss and number of clusters --> save
-        the plot --> get the optimal number of clusters (knee)
-        returns: kn.knee
+        This method fits the k-means++ clustering for one number of clusters and returns its WCSS.
+        params: data, n_clusters, minibatch (fit a mini-batch k-means instead of the full k-means)
+        returns: wcss (inertia of the fitted model over all the rows of data)
         """
-        self.logger_object.log(self.file_object, 'Entered the elbow_plot method of the KMeansClustering class')
-        wcss = list()  # initializing an empty list
-        for i in range(1, 11):
-            kmeans = KMeans(n_clusters=i, init='k-means++', random_state=42)  # initializing the KMeans object
-            kmeans.fit(data)  # fitting the data to the KMeans Algorithm
-            wcss.append(kmeans.inertia_)
-        plt.plot(range(1, 11), wcss)  # creating the graph between WCSS and the number of clusters
+        if minibatch:
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, init='k-means++', random_state=42)
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, init='k-means++', random_state=42)  # initializing the KMeans object
+        kmeans.fit(data)  # fitting the data to the KMeans Algorithm
+        return kmeans.inertia_
+
+    def wcss_curve(self, data, k_range, n_jobs=1, minibatch=False):
+        """
+        This method computes the WCSS of every number of clusters of the range.
+        params: data (float matrix), k_range, n_jobs, minibatch
+        Fit every number of clusters, in parallel processes when n_jobs is not 1.
+        returns: wcss list in the order of k_range
+        """
+        if n_jobs == 1:
+            return [self.wcss_for_k(data, k, minibatch) for k in k_range]
+        # the workers get the matrix memory-mapped, the results come back in the order of k_range
+        return Parallel(n_jobs=n_jobs)(delayed(self.wcss_for_k)(data, k, minibatch) for k in k_range)
+
+    @staticmethod
+    def save_elbow_plot(k_range, wcss, path='preprocessing_data/K-Means_Elbow.PNG'):
+        """
+        This method saves the graph between the WCSS and the number of clusters.
+        params: k_range, wcss, path
+        returns: None
+        """
+        import matplotlib
+        matplotlib.use('Agg')  # no display is needed to save the image
+        import matplotlib.pyplot as plt
+        plt.figure()
+        plt.plot(k_range, wcss)  # creating the graph between WCSS and the number of clusters
         plt.title('The Elbow Method')
         plt.xlabel('Number of clusters')
         plt.ylabel('WCSS')
-        # plt.show()
-        plt.savefig('preprocessing_data/K-Means_Elbow.PNG')  # saving the elbow plot locally
+        plt.savefig(path)  # saving the elbow plot locally
+        plt.close()
+
+    @staticmethod
+    def sample_rows(row_count, sample_size, labels=None, random_state=42):
+        """
+        This method draws the rows of the sample used to choose the number of clusters.
+        params: row_count, sample_size, labels (the sample keeps the proportions of the labels when given),
+        random_state
+        returns: sorted row positions
+        """
+        rows = np.arange(row_count)
+        if labels is not None:
+            rows, _ = train_test_split(rows, train_size=sample_size, stratify=np.asarray(labels),
+                                       random_state=random_state)
+        else:
+            rows = np.random.RandomState(random_state).choice(row_count, sample_size, replace=False)
+        return np.sort(rows)
+
+    def elbow_plot(self, data, k_range=range(1, 11), n_jobs=1, mode='exact', sample_size=100000, labels=None,
+                   validate=False, save_plot=False):
+        """
+        This method analyzes the data and returns an elbow plot diagram which displays the best number of clusters.
+        params: data, k_range (numbers of clusters tried), n_jobs (number of processes fitting the numbers of clusters
+        in parallel, -1 for all the cores), mode ('exact' fits k-means on all the rows, 'sample' fits k-means on a
+        sample of sample_size rows, stratified by labels when given, 'minibatch' fits mini-batch k-means on all the
+        rows), sample_size, labels, validate (also compute the exact curve and report how close the curve of the mode
+        is to it), save_plot (save the elbow plot image to preprocessing_data)
+        Convert the data to a float matrix once --> fit every number of clusters of the range with the mode --> find
+        the wcss, scaled to the number of rows of the data for a sample --> plot the graph between wcss and number of
+        clusters and save it if asked --> get the optimal number of clusters (knee) --> compare with the exact knee and
+        curve when validating. The knee and the curves are kept in the elbow_report attribute.
+        returns: kn.knee
+        """
+        self.logger_object.log(self.file_object, 'Entered the elbow_plot method of the KMeansClustering class')
+        if mode not in ('exact', 'sample', 'minibatch'):
+            raise ValueError('Unknown elbow mode %s' % mode)
+        k_range = list(k_range)
+        # the same conversion KMeans.fit does, done once instead of once per number of clusters
+        values = check_array(data, dtype=[np.float64, np.float32])
+        if mode == 'sample' and sample_size < len(values):
+            sample = values[self.sample_rows(len(values), sample_size, labels)]
+            # the WCSS grows with the number of rows, scale it as if the whole data was clustered
+            wcss = [w * len(values) / len(sample) for w in self.wcss_curve(sample, k_range, n_jobs)]
+        else:
+            wcss = self.wcss_curve(values, k_range, n_jobs, minibatch=mode == 'minibatch')
+        if save_plot:
+            self.save_elbow_plot(k_range, wcss)
+        from kneed import KneeLocator
         # finding the value of the optimum cluster programmatically
-        kn = KneeLocator(range(1, 11), wcss, curve='convex', direction='decreasing')
+        kn = KneeLocator(k_range, wcss, curve='convex', direction='decreasing')
+        self.elbow_report = {'mode': mode, 'k_range': k_range, 'knee': kn.knee, 'wcss': wcss}
+        if validate and mode != 'exact':
+            exact_wcss = self.wcss_curve(values, k_range, n_jobs)
+            exact_knee = KneeLocator(k_range, exact_wcss, curve='convex', direction='decreasing').knee
+            error = max(abs(w - e) / e for w, e in zip(wcss, exact_wcss) if e > 0)
+            self.elbow_report.update({'exact_knee': exact_knee, 'exact_wcss': exact_wcss,
+                                      'max_relative_wcss_error': error})
+            self.logger_object.log(self.file_object, 'Elbow mode ' + mode + ' knee: ' + str(kn.knee) + ', exact knee: '
+                                   + str(exact_knee) + ', maximum relative WCSS error: ' + str(round(error, 4)))
         self.logger_object.log(self.file_object, 'The optimum number of clusters is: ' + str(kn.knee) +
                                ' . Exited the elbow_plot method of the KMeansClustering class')
         return kn.knee
 
-    def create_clusters(self, data, number_of_clusters):
+    def create_clusters(self, data, number_of_clusters, file_op=None):
         """
-        Create a new dataframe with the cluster information of the data.
-        params: data, number_of_clusters
+        Find the cluster of every row of the data.
+        params: data, number_of_clusters, file_op (FileOperation saving the models of the training run)
         create an object of k means ++ clustering algorithm --> divide the data into clusters --> save the kmeans model
-        --> add a cluster column in the dataframe with its cluster information.
-        returns: data
+        --> return the cluster of every row, the data itself is left unchanged.
+        returns: cluster numbers array
         """
         self.logger_object.log(self.file_object, 'Entered the create_clusters method of the KMeansClustering class')
         kmeans = KMeans(n_clusters=number_of_clusters, init='k-means++', random_state=42)
         y_kmeans = kmeans.fit_predict(data)  # divide data into clusters
-        file_op = file_methods.FileOperation(self.file_object, self.logger_object)
+        if file_op is None:
+            file_op = file_methods.FileOperation(self.file_object, self.logger_object)
         file_op.save_model(kmeans, 'KMeans')  # saving the KMeans model to directory
-        # passing 'Model' as the functions need three parameters
-        data['Cluster'] = y_kmeans  # create a new column in dataset for storing the cluster information
-        return data
+        return y_kmeans
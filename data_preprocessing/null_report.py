@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+class NullReport:
+    """
+    This class holds the missing values profile of a dataframe: the count and the ratio of missing values of every
+    column and the columns which have missing values. It is computed in one vectorized pass per block of columns
+    sharing a dtype, so later steps can reuse it instead of checking the data again.
+    """
+
+    def __init__(self, columns, counts, row_count):
+        self.columns = list(columns)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.row_count = row_count
+
+    @staticmethod
+    def from_dataframe(data):
+        """
+        This method profiles the missing values of a dataframe.
+        params: data
+        Group the columns by dtype --> count the NaN of the float blocks with one isnan pass over the numpy block -->
+        integer and boolean numpy columns can't hold missing values --> the other columns (nullable integers,
+        objects) are counted with pandas.
+        returns: NullReport
+        """
+        counts = np.zeros(len(data.columns), dtype=np.int64)
+        positions = dict()
+        for i, dtype in enumerate(data.dtypes):
+            positions.setdefault(dtype, list()).append(i)
+        for dtype, block_positions in positions.items():
+            if isinstance(dtype, np.dtype) and dtype.kind in 'iub':
+                continue
+            block = data.iloc[:, block_positions]
+            if isinstance(dtype, np.dtype) and dtype.kind == 'f':
+                counts[block_positions] = np.isnan(block.to_numpy()).sum(axis=0)
+            else:
+                counts[block_positions] = block.isna().sum().to_numpy()
+        return NullReport(data.columns, counts, len(data))
+
+    @property
+    def ratios(self):
+        """
+        Ratio of missing values of every column.
+        """
+        if self.row_count == 0:
+            return np.zeros(len(self.columns))
+        return self.counts / self.row_count
+
+    @property
+    def columns_with_nulls(self):
+        """
+        Names of the columns which have missing values.
+        """
+        return [column for column, count in zip(self.columns, self.counts) if count > 0]
+
+    @property
+    def null_present(self):
+        """
+        True if some values are missing.
+        """
+        return bool(self.counts.any())
+
+    def to_frame(self):
+        """
+        This method returns the report as a dataframe with one row per column.
+        params: None
+        returns: dataframe
+        """
+        report = pd.DataFrame()
+        report['columns'] = self.columns
+        report['missing values count'] = self.counts
+        report['missing values ratio'] = self.ratios
+        return report
+
+    def write(self, path):
+        """
+        This method writes the report to a csv file.
+        params: path
+        returns: None
+        """
+        self.to_frame().to_csv(path)
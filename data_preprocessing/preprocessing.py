@@ -1,8 +1,6 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import KNNImputer
-from imblearn.over_sampling import RandomOverSampler
+from data_preprocessing.null_report import NullReport
 
 
 class Preprocessor:
@@ -13,6 +11,7 @@ class Preprocessor:
     def __init__(self, file_object, logger_object):
         self.file_object = file_object
         self.logger_object = logger_object
+        self.null_report = None  # missing values profile of the last data checked
 
     def remove_unwanted_spaces(self, data):
         """
@@ -55,66 +54,143 @@ class Preprocessor:
                                                  'method of the Preprocessor class')
         return x, y
 
-    def is_null_present(self, data):
+    def profile_nulls(self, data):
         """
-        This method checks whether there are null values present in the pandas Dataframe or not.
+        This method profiles the missing values of the pandas Dataframe.
         params: data
+        Count the missing values of every column in one vectorized pass per dtype block.
+        returns: NullReport with the counts, the ratios and the columns with null values
+        """
+        self.logger_object.log(self.file_object, 'Entered the profile_nulls method of the Preprocessor class')
+        self.null_report = NullReport.from_dataframe(data)
+        self.logger_object.log(self.file_object, str(len(self.null_report.columns_with_nulls)) + ' columns with null '
+                                                 'values. Exited the profile_nulls method of the Preprocessor class')
+        return self.null_report
 
+    def is_null_present(self, data, write_report=False):
+        """
+        This method checks whether there are null values present in the pandas Dataframe or not.
+        params: data, write_report (write the null values report file when null values are present)
+        Profile the missing values --> write the report to the null values file if asked. The report is kept in the
+        null_report attribute for the later steps.
         returns: True if null values are present in the DataFrame, False if they are not present and
                 returns the list of columns for which null values are present.
         """
         self.logger_object.log(self.file_object, 'Entered the is_null_present method of the Preprocessor class')
-        null_present = False
-        cols_with_missing_values = list()
-        cols = data.columns
-        null_counts = data.isna().sum()  # check for the count of null values per column
-        for i in range(len(null_counts)):
-            if null_counts[i] > 0:
-                null_present = True
-                cols_with_missing_values.append(cols[i])
-        if null_present:  # write the logs to see which columns have null values
-            dataframe_with_null = pd.DataFrame()
-            dataframe_with_null['columns'] = data.columns
-            dataframe_with_null['missing values count'] = np.asarray(data.isna().sum())
-            dataframe_with_null.to_csv(
-                'preprocessing_data/null_values.csv')  # storing the null column information to file
-        self.logger_object.log(self.file_object, 'Finding missing values is a success.Data written to the null values '
-                                                 'file. Exited the is_null_present method of the Preprocessor class')
-        return null_present, cols_with_missing_values
+        report = self.profile_nulls(data)
+        if report.null_present and write_report:  # write the logs to see which columns have null values
+            report.write('preprocessing_data/null_values.csv')  # storing the null column information to file
+            self.logger_object.log(self.file_object, 'Data written to the null values file.')
+        self.logger_object.log(self.file_object, 'Finding missing values is a success. Exited the is_null_present '
+                                                 'method of the Preprocessor class')
+        return report.null_present, report.columns_with_nulls
 
-    def impute_missing_values(self, data, cols_with_missing_values):
-        """
-        This method replaces all the missing values in the Dataframe using KNN imputer.
-        Iterate over columns with missing values --> impute the missing values with KNN.
+    def fit_imputer(self, data, n_neighbors=2, max_fit_samples=50000, random_state=42):
+        """
+        This method fits one KNN imputer over all the feature columns, so that the neighbours of a row are searched
+        using every feature. The imputer is fitted once during training and saved with the models.
+        params: data, n_neighbors, max_fit_samples (the imputer keeps its fit rows, so at most this many rows are
+        sampled to bound its size), random_state
+        Convert the features to float32 with NaN for the missing values --> sample the rows if there are too many -->
+        fit the KNN imputer.
+        returns: imputer
+        """
+        self.logger_object.log(self.file_object, 'Entered the fit_imputer method of the Preprocessor class')
+        from sklearn.impute import KNNImputer  # only needed to fit, the prediction loads the saved imputer
+        values = data.astype(np.float32).to_numpy()
+        if max_fit_samples is not None and len(values) > max_fit_samples:
+            rows = np.random.RandomState(random_state).choice(len(values), max_fit_samples, replace=False)
+            values = values[np.sort(rows)]
+        imputer = KNNImputer(n_neighbors=n_neighbors)
+        imputer.fit(values)
+        self.logger_object.log(self.file_object, 'Imputer fitted on ' + str(len(values)) + ' rows. Exited the '
+                                                 'fit_imputer method of the Preprocessor class')
+        return imputer
+
+    def impute_missing_values(self, data, cols_with_missing_values, imputer=None, working_memory=64):
+        """
+        This method replaces all the missing values in the Dataframe using a KNN imputer fitted over all the feature
+        columns. At prediction time the imputer saved during training is passed and is only used to transform.
+        params: data, cols_with_missing_values, imputer (fitted imputer, fitted on the data when None),
+        working_memory (MiB taken by the distances of each block of rows to the rows the imputer was fitted on)
+        Take the rows with missing values --> impute them with the multi-column KNN imputer in blocks of rows, the
+        imputer computing the distances of a whole block to all its fit rows at once --> write every imputed block back
+        in place --> replace the columns with missing values by their imputed float32 values.
         returns: data
         """
         self.logger_object.log(self.file_object, 'Entered the impute_missing_values method of the Preprocessor class')
-        imputer = KNNImputer(n_neighbors=2)
+        if imputer is None:
+            imputer = self.fit_imputer(data)
+        values = np.require(data.astype(np.float32).to_numpy(), requirements='W')  # imputed in place
+        rows = np.flatnonzero(np.isnan(values).any(axis=1))
+        if not len(rows):
+            return data
+        # one float64 distance per row of the block and fit row, the fit rows being kept by the imputer
+        block_rows = max(1, int(working_memory * 2 ** 20 // (8 * max(1, len(imputer._fit_X)))))
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            values[block] = imputer.transform(values[block])
         for col in cols_with_missing_values:
-            data[col] = imputer.fit_transform(data[col])
+            i = data.columns.get_loc(col)
+            data[col] = values[:, i].copy()
         self.logger_object.log(self.file_object, 'Imputing missing values Successful. Exited the '
                                                  'impute_missing_values method of the Preprocessor class')
         return data
 
-    def scale_numerical_columns(self, data):
+    def fit_scaler(self, data, chunk_size=100000):
+        """
+        This method fits one standard scaler over the numerical columns. It is fitted once during training and saved
+        with the models, so the prediction data is only transformed.
+        params: data (dataframe, or an iterable of dataframe chunks when the data does not fit in memory), chunk_size
+        Iterate over the data in chunks of rows --> update the mean and variance of the scaler with each chunk
+        (partial_fit), so only one chunk at a time is converted to float.
+        returns: scaler
+        """
+        self.logger_object.log(self.file_object, 'Entered the fit_scaler method of the Preprocessor class')
+        from sklearn.preprocessing import StandardScaler  # only needed to fit, the prediction loads the saved scaler
+        chunks = data
+        if isinstance(data, pd.DataFrame):
+            chunks = (data.iloc[start:start + chunk_size] for start in range(0, len(data), chunk_size))
+        scaler = StandardScaler()
+        for chunk in chunks:
+            scaler.partial_fit(chunk.select_dtypes(include=[np.number]).to_numpy(dtype=np.float64))
+        self.logger_object.log(self.file_object, 'Scaler fitted on ' + str(scaler.n_samples_seen_) + ' rows. Exited '
+                                                 'the fit_scaler method of the Preprocessor class')
+        return scaler
+
+    def scale_numerical_columns(self, data, scaler=None):
         """
         This method scales all the numerical values using the Standard scaler to scale all the numbers in the
         same range.
-        params: data
-        create a df of the columns with datatype as int64 --> transform the data using standard scaler --> create a
-        dataframe of the scaled columns.
+        params: data, scaler (fitted scaler, fitted on the data when None)
+        create a df of the numerical columns, whatever their integer or float width --> convert them to a float32
+        block --> subtract the mean and divide by the scale of the scaler in place --> create a dataframe of the
+        scaled columns.
         returns: scaled_df
         """
-        scaler = StandardScaler()
         self.logger_object.log(self.file_object, 'Entered the scale_numerical_columns method of the '
                                                  'Preprocessor class')
-        num_df = data.select_dtypes(include=['int64']).copy()
-        scaled_data = scaler.fit_transform(num_df)
+        num_df = data.select_dtypes(include=[np.number])
+        if scaler is None:
+            scaler = self.fit_scaler(num_df)
+        scaled_data = self.scale_matrix(num_df.to_numpy(dtype=np.float32, copy=True), scaler)
         scaled_df = pd.DataFrame(data=scaled_data, columns=num_df.columns)
         self.logger_object.log(self.file_object, 'scaling for numerical values successful. Exited the '
                                                  'scale_numerical_columns method of the Preprocessor class')
         return scaled_df
 
+    @staticmethod
+    def scale_matrix(values, scaler):
+        """
+        This method scales a float32 matrix in place with a fitted standard scaler.
+        params: values, scaler
+        Subtract the mean and divide by the scale of the scaler, without allocating a new matrix.
+        returns: values
+        """
+        values -= scaler.mean_.astype(np.float32)
+        values /= scaler.scale_.astype(np.float32)
+        return values
+
     def encode_categorical_columns(self, data):
         """
         This method encodes the categorical values to numeric values using an encoder.
@@ -141,6 +217,7 @@ class Preprocessor:
         """
         self.logger_object.log(self.file_object,
                                'Entered the handle_imbalanced_dataset method of the Preprocessor class')
+        from imblearn.over_sampling import RandomOverSampler  # heavy import, only needed on this training path
         random_sampler = RandomOverSampler()
         x_sampled, y_sampled = random_sampler.fit_sample(x, y)
         self.logger_object.log(self.file_object, 'dataset balancing successful. Exited the '
@@ -0,0 +1,182 @@
+import csv
+import os
+import re
+import shutil
+from collections import namedtuple
+import pandas as pd
+from joblib import Parallel, delayed
+
+# Outcome of the validation of a single batch file. 'reason' is the log message describing the verdict and
+# 'needs_rewrite' tells whether the file has missing values which have to be replaced with "NULL".
+FileVerdict = namedtuple('FileVerdict', ['filename', 'is_good', 'reason', 'needs_rewrite'])
+
+# Values which are stored as NULL in the table: the default missing value markers of pandas.read_csv. The validation
+# reads the files with exactly these markers, so a value it counts as missing is the one stored as NULL.
+MISSING_VALUE_TOKENS = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                        '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+
+class BatchFileValidator:
+    """
+    This class validates a raw batch file in a single streaming pass. The file name, the number of columns and the
+    columns with all values missing are checked while the file is read only once, in chunks.
+    """
+
+    def __init__(self, regex, length_of_date_stamp_in_file, length_of_time_stamp_in_file, number_of_columns,
+                 chunk_size=10000):
+        self.regex = regex
+        self.length_of_date_stamp_in_file = length_of_date_stamp_in_file
+        self.length_of_time_stamp_in_file = length_of_time_stamp_in_file
+        self.number_of_columns = number_of_columns
+        self.chunk_size = chunk_size
+
+    def is_valid_file_name(self, filename):
+        """
+        This method validates the name of the file against the regex and the length of the date and time stamps.
+        params: filename
+        Compare the file name with the regex --> split the name at the underscores --> check the length of the date
+        and time stamps.
+        returns: True if the file name is valid, False otherwise
+        """
+        if not re.match(self.regex, filename):
+            return False
+        name_dstamp_tstamp = filename.split('.')[0].split('_')  # ['creditCardFraud', '28011960', '120210']
+        if len(name_dstamp_tstamp) < 3:
+            return False
+        return len(name_dstamp_tstamp[1]) == self.length_of_date_stamp_in_file and \
+            len(name_dstamp_tstamp[2]) == self.length_of_time_stamp_in_file
+
+    def validate_file(self, batch_directory, filename):
+        """
+        This method validates a single file without modifying it.
+        params: batch_directory, filename
+        Validate the file name --> read the file in chunks --> check the number of columns from the header --> count
+        the non-null values of every column over all the chunks --> a column without any value makes the file bad.
+        returns: FileVerdict
+        """
+        if not self.is_valid_file_name(filename):
+            return FileVerdict(filename, False, 'Invalid File Name', False)
+        non_null_counts = None
+        has_missing_values = False
+        try:
+            for chunk in pd.read_csv(os.path.join(batch_directory, filename), chunksize=self.chunk_size,
+                                     keep_default_na=False, na_values=list(MISSING_VALUE_TOKENS)):
+                if chunk.shape[1] != self.number_of_columns:
+                    return FileVerdict(filename, False, 'Invalid Column Length', False)
+                counts = chunk.notna().sum().values
+                non_null_counts = counts if non_null_counts is None else non_null_counts + counts
+                has_missing_values = has_missing_values or bool((counts < len(chunk)).any())
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError):
+            return FileVerdict(filename, False, 'Invalid Column Length', False)
+        if non_null_counts is None or (non_null_counts == 0).any():
+            return FileVerdict(filename, False, 'Invalid Column', False)
+        return FileVerdict(filename, True, 'Valid File', has_missing_values)
+
+    def validate_files(self, batch_directory, filenames, n_jobs=1):
+        """
+        This method validates a list of files, optionally spreading them across a pool of worker processes.
+        params: batch_directory, filenames, n_jobs (number of worker processes, -1 uses all the cores)
+        Every worker validates its files independently and returns their verdicts --> the verdicts are returned in the
+        order of the file names, so the result does not depend on the number of workers.
+        returns: list of verdicts
+        """
+        if n_jobs == 1:
+            return [self.validate_file(batch_directory, filename) for filename in filenames]
+        return Parallel(n_jobs=n_jobs, batch_size='auto')(
+            delayed(self.validate_file)(batch_directory, filename) for filename in filenames)
+
+    @staticmethod
+    def rewrite_with_nulls(source, destination):
+        """
+        This method writes a copy of the file in which the missing values are replaced with "NULL".
+        params: source, destination
+        Stream the rows of the source file --> replace the missing values --> write them to the destination.
+        returns: None
+        """
+        with open(source, 'r', newline='') as src, open(destination, 'w', newline='') as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            writer.writerow(next(reader))
+            for row in reader:
+                writer.writerow(['NULL' if value in MISSING_VALUE_TOKENS else value for value in row])
+
+    @staticmethod
+    def link_file(source, directory):
+        """
+        This method places a file into a folder without copying its content: the file is hard linked into it, and
+        only copied when the folder is on another file system or does not support hard links. The files placed are
+        only read, then removed or moved, so the batch file sharing their content is never modified through them.
+        params: source, directory
+        returns: None
+        """
+        destination = os.path.join(directory, os.path.basename(source))
+        try:
+            if os.path.lexists(destination):  # left by an earlier run
+                os.remove(destination)
+            os.link(source, destination)
+        except OSError:
+            shutil.copy(source, destination)
+
+    def place_file(self, batch_directory, verdict, good_directory, bad_directory):
+        """
+        This method places a validated file into the good or bad raw folder. Only the good files with missing values
+        are rewritten, all the other files are linked as they are.
+        params: batch_directory, verdict, good_directory, bad_directory
+        returns: None
+        """
+        source = os.path.join(batch_directory, verdict.filename)
+        if not verdict.is_good:
+            self.link_file(source, bad_directory)
+        elif verdict.needs_rewrite:
+            self.rewrite_with_nulls(source, os.path.join(good_directory, verdict.filename))
+        else:
+            self.link_file(source, good_directory)
+
+
+class TypedRowParser:
+    """
+    This class converts the rows of a good raw file into tuples typed after the declared column types of the table.
+    The missing values become None and a value which does not match the type of its column raises a ValueError, so
+    that the file can be rejected.
+    """
+
+    def __init__(self, column_types):
+        self.converters = [self.converter_for_type(column_type) for column_type in column_types]
+
+    @staticmethod
+    def to_integer(value):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            number = float(value)  # accepts values such as '20000.0'
+        except ValueError:
+            number = None
+        if number is None or not number.is_integer():
+            raise ValueError("invalid value for an Integer column: '%s'" % value)
+        return int(number)
+
+    def converter_for_type(self, column_type):
+        """
+        This method returns the function converting a value to the given SQL column type.
+        params: column_type
+        returns: converter
+        """
+        column_type = column_type.upper()
+        if 'INT' in column_type:
+            return self.to_integer
+        if column_type in ('REAL', 'FLOAT', 'DOUBLE'):
+            return float
+        return str
+
+    def parse(self, row):
+        """
+        This method converts a row of strings into a typed tuple.
+        params: row
+        returns: tuple of values
+        """
+        if len(row) != len(self.converters):
+            raise ValueError('Row has %s values, expected %s' % (len(row), len(self.converters)))
+        return tuple(None if value in MISSING_VALUE_TOKENS else convert(value)
+                     for convert, value in zip(self.converters, row))
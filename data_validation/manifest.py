@@ -0,0 +1,147 @@
+import hashlib
+import os
+import sqlite3
+
+
+class FileManifest:
+    """
+    This class keeps a persistent record of the batch files which have already been validated and inserted, so that a
+    rerun only processes the new or changed files. The records are stored in the 'File_Manifest' table of the
+    database the good data is inserted into, keyed by the absolute path of the files, so the files of the same name
+    in different batch directories are different files.
+    """
+
+    def __init__(self, database_path, batch_directory):
+        self.batch_directory = batch_directory
+        self.conn = sqlite3.connect(database_path)
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(File_Manifest)')]
+        if columns and 'file_path' not in columns:  # records of an older version keyed by the file name only
+            self.conn.execute('DROP TABLE File_Manifest')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS File_Manifest (file_path TEXT PRIMARY KEY, size INTEGER, '
+                          'mtime REAL, content_hash TEXT, is_good INTEGER, reason TEXT, inserted INTEGER, '
+                          'row_count INTEGER)')
+        self.conn.commit()
+        self.hashes = dict()  # content hashes computed during this run, reused when recording the verdicts
+
+    def file_path(self, filename):
+        """
+        This method returns the key of a file of the batch directory.
+        params: filename
+        returns: absolute path
+        """
+        return os.path.abspath(os.path.join(self.batch_directory, filename))
+
+    @staticmethod
+    def content_hash(file_path, block_size=1 << 20):
+        """
+        This method computes the sha256 hash of the content of a file.
+        params: file_path, block_size
+        returns: hex digest
+        """
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def pending_files(self, filenames):
+        """
+        This method finds the files of the batch directory which have to be validated and inserted.
+        params: filenames
+        Iterate over the files --> a file whose size and modification time match its record is unchanged --> else
+        compare the content hash with the recorded one --> unchanged files only get their size and modification time
+        refreshed --> new files, changed files and files which were good but never inserted are pending.
+        returns: pending file names, names of the already inserted files whose content changed
+        """
+        records = {row[0]: row[1:] for row in self.conn.execute(
+            'SELECT file_path, size, mtime, content_hash, is_good, inserted FROM File_Manifest')}
+        pending = list()
+        changed_inserted = list()
+        for filename in filenames:
+            file_path = self.file_path(filename)
+            stat = os.stat(file_path)
+            record = records.get(file_path)
+            if record is not None and record[0] == stat.st_size and record[1] == stat.st_mtime:
+                if record[3] and not record[4]:  # good file from an interrupted run
+                    pending.append(filename)
+                continue
+            content_hash = self.content_hash(file_path)
+            self.hashes[filename] = content_hash
+            if record is not None and record[2] == content_hash:
+                self.conn.execute('UPDATE File_Manifest SET size = ?, mtime = ? WHERE file_path = ?',
+                                  (stat.st_size, stat.st_mtime, file_path))
+                if record[3] and not record[4]:
+                    pending.append(filename)
+                continue
+            pending.append(filename)
+            if record is not None and record[4]:
+                changed_inserted.append(filename)
+        self.conn.commit()
+        return pending, changed_inserted
+
+    def record_verdicts(self, verdicts):
+        """
+        This method stores the validation verdicts of the files, marking them as not inserted yet.
+        params: verdicts
+        returns: None
+        """
+        for verdict in verdicts:
+            file_path = self.file_path(verdict.filename)
+            stat = os.stat(file_path)
+            content_hash = self.hashes.get(verdict.filename) or self.content_hash(file_path)
+            self.conn.execute('INSERT OR REPLACE INTO File_Manifest VALUES (?, ?, ?, ?, ?, ?, 0, 0)',
+                              (file_path, stat.st_size, stat.st_mtime, content_hash, int(verdict.is_good),
+                               verdict.reason))
+        self.conn.commit()
+
+    def mark_inserted(self, filename, row_count, conn=None):
+        """
+        This method records that a file of the batch directory has been inserted into the table. When a connection is
+        passed, the update is part of the transaction of that connection and is committed with the inserted rows.
+        params: filename, row_count, conn
+        returns: None
+        """
+        db = conn if conn is not None else self.conn
+        db.execute('UPDATE File_Manifest SET inserted = 1, row_count = ? WHERE file_path = ?',
+                   (row_count, self.file_path(filename)))
+        if conn is None:
+            self.conn.commit()
+
+    def mark_bad(self, filename, reason, conn=None):
+        """
+        This method records that a file of the batch directory which passed the validation could not be inserted into
+        the table.
+        params: filename, reason, conn
+        returns: None
+        """
+        db = conn if conn is not None else self.conn
+        db.execute('UPDATE File_Manifest SET is_good = 0, inserted = 0, row_count = 0, reason = ? WHERE file_path = ?',
+                   (reason, self.file_path(filename)))
+        if conn is None:
+            self.conn.commit()
+
+    def inserted_row_count(self):
+        """
+        This method returns the number of rows the recorded files have inserted into the table.
+        params: None
+        returns: row count
+        """
+        cursor = self.conn.execute('SELECT COALESCE(SUM(row_count), 0) FROM File_Manifest WHERE inserted = 1')
+        return cursor.fetchone()[0]
+
+    def reset(self):
+        """
+        This method deletes all the records, so that every file is validated and inserted again.
+        params: None
+        returns: None
+        """
+        self.conn.execute('DELETE FROM File_Manifest')
+        self.conn.commit()
+
+    def close(self):
+        """
+        This method closes the connection to the database.
+        params: None
+        returns: None
+        """
+        self.conn.close()
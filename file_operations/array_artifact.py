@@ -0,0 +1,191 @@
+import copy
+import os
+import pickle
+import numpy as np
+
+HEADER_NAME = 'header.pkl'
+ARTIFACT_FORMAT = 2
+
+
+class ArrayArtifact:
+    """
+    This class saves a model as a directory holding its numeric arrays as .npy files and a small pickled header with
+    the rest of the model. The arrays are loaded memory-mapped, copy-on-write so the compiled sklearn code accepts
+    them, which lets the processes loading the same model share the pages of the arrays through the page cache
+    instead of each holding a private copy. The trees of a forest are stored twice: as the node and value arrays of
+    all the trees laid end to end, rebuilt into sklearn trees in private memory when the sklearn forest is used, and
+    compiled into the flat arrays of FlatForest, which score the forest from the shared pages directly.
+    """
+
+    @staticmethod
+    def split_arrays(estimator, directory, prefix=''):
+        """
+        This method moves the numeric arrays of an estimator out of it.
+        params: estimator, directory, prefix (of the array files)
+        Save every numeric array attribute to a .npy file --> copy the estimator without them.
+        returns: shell estimator, list of (attribute, file name)
+        """
+        shell = copy.copy(estimator)
+        arrays = list()
+        for attribute, value in vars(estimator).items():
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                file_name = prefix + attribute + '.npy'
+                np.save(os.path.join(directory, file_name), value)
+                arrays.append((attribute, file_name))
+                setattr(shell, attribute, None)
+        return shell, arrays
+
+    @staticmethod
+    def is_forest(model):
+        """
+        This method checks whether a model is a forest of sklearn decision trees.
+        params: model
+        returns: True or False
+        """
+        estimators = getattr(model, 'estimators_', None)
+        return isinstance(estimators, list) and len(estimators) > 0 and all(
+            hasattr(estimator, 'tree_') for estimator in estimators)
+
+    @staticmethod
+    def save(model, directory):
+        """
+        This method saves a model in the array format.
+        params: model, directory (created)
+        For a forest: lay the node and value arrays of the trees end to end --> save them with the offsets of the
+        trees --> keep the trees without their node arrays in the header --> save the flat arrays the forest compiles
+        into --> for any model: save its numeric arrays --> pickle the header.
+        returns: None
+        """
+        from model_inference.flat_forest import FlatForest  # imported here, it imports this module
+        os.makedirs(directory)
+        header = {'format': ARTIFACT_FORMAT, 'trees': None, 'flat': None}
+        if ArrayArtifact.is_forest(model):
+            flat_forest = FlatForest.compile(model)
+            if flat_forest is not None:  # None for the forests FlatForest can't score
+                np.save(os.path.join(directory, 'flat_nodes.npy'), flat_forest.nodes)
+                np.save(os.path.join(directory, 'flat_probabilities.npy'), flat_forest.probabilities)
+                np.save(os.path.join(directory, 'flat_roots.npy'), flat_forest.roots)
+                header['flat'] = (flat_forest.max_depth, flat_forest.n_features)
+            states = [estimator.tree_.__getstate__() for estimator in model.estimators_]
+            np.save(os.path.join(directory, 'tree_nodes.npy'), np.concatenate([state['nodes'] for state in states]))
+            np.save(os.path.join(directory, 'tree_values.npy'), np.concatenate([state['values'] for state in states]))
+            np.save(os.path.join(directory, 'tree_offsets.npy'),
+                    np.cumsum([0] + [state['node_count'] for state in states]))
+            trees = list()
+            for estimator, state in zip(model.estimators_, states):
+                tree_shell = copy.copy(estimator)
+                tree_shell.tree_ = None
+                trees.append((tree_shell, estimator.tree_.n_features, np.asarray(estimator.tree_.n_classes),
+                              estimator.tree_.n_outputs, state['max_depth']))
+            header['trees'] = trees
+            model = copy.copy(model)
+            model.estimators_ = list()
+        header['model'], header['arrays'] = ArrayArtifact.split_arrays(model, directory)
+        with open(os.path.join(directory, HEADER_NAME), 'wb') as f:
+            pickle.dump(header, f)
+
+    @staticmethod
+    def load(directory):
+        """
+        This method loads a model saved in the array format.
+        params: directory
+        Unpickle the header --> map the arrays back into the model --> a forest is returned as a LazyForest, with its
+        flat arrays mapped read only.
+        returns: model
+        """
+        with open(os.path.join(directory, HEADER_NAME), 'rb') as f:
+            header = pickle.load(f)
+        model = header['model']
+        for attribute, file_name in header['arrays']:
+            setattr(model, attribute, np.load(os.path.join(directory, file_name), mmap_mode='c'))
+        if header['trees'] is None:
+            return model
+        flat_arrays = None
+        if header.get('flat') is not None:  # not saved by the first version of the format
+            flat_arrays = (np.load(os.path.join(directory, 'flat_nodes.npy'), mmap_mode='r'),
+                           np.load(os.path.join(directory, 'flat_probabilities.npy'), mmap_mode='r'),
+                           np.load(os.path.join(directory, 'flat_roots.npy'))) + tuple(header['flat'])
+        return LazyForest(model, header['trees'], np.load(os.path.join(directory, 'tree_nodes.npy'), mmap_mode='c'),
+                          np.load(os.path.join(directory, 'tree_values.npy'), mmap_mode='c'),
+                          np.load(os.path.join(directory, 'tree_offsets.npy')), flat_arrays)
+
+    @staticmethod
+    def private_bytes(directory):
+        """
+        This method estimates the memory a loaded model takes in the loading process alone: the header, the arrays
+        being shared. See LazyForest.private_bytes for what a forest copies into private memory once loaded.
+        params: directory
+        returns: bytes
+        """
+        return os.path.getsize(os.path.join(directory, HEADER_NAME))
+
+
+class LazyForest:
+    """
+    This class holds a forest loaded from the array format: the node and value arrays of all its trees and its flat
+    arrays, memory-mapped. FlatForest scores it from the flat arrays, in the shared pages. The sklearn forest is only
+    rebuilt, into private memory, when one of its attributes or methods is first used.
+    """
+
+    def __init__(self, shell, trees, nodes, values, offsets, flat_arrays=None):
+        self.shell = shell  # forest without its trees
+        self.trees = trees  # (tree without its nodes, n_features, n_classes, n_outputs, max_depth) of every tree
+        self.nodes = nodes  # node records of all the trees, laid end to end
+        self.values = values  # node values of all the trees
+        self.offsets = offsets  # first node of every tree, and the node count at the end
+        # nodes, probabilities, roots, max_depth and n_features of the compiled FlatForest, None when not saved
+        self.flat_arrays = flat_arrays
+        self.model = None
+        self.flat_forest = None  # see FlatForest.for_model
+
+    def private_bytes(self):
+        """
+        This method returns the memory the forest copied out of the mapped arrays: the rebuilt sklearn trees, and the
+        flat arrays when they were compiled in the process instead of being mapped.
+        params: None
+        returns: bytes
+        """
+        size = 0
+        if self.model is not None:
+            size += self.nodes.nbytes + self.values.nbytes
+        if self.flat_forest is not None and self.flat_arrays is None:
+            size += self.flat_forest.nodes.nbytes + self.flat_forest.probabilities.nbytes
+        return size
+
+    def tree_arrays(self, k):
+        """
+        This method returns the nodes and the values of a tree.
+        params: k (tree number)
+        returns: nodes, values
+        """
+        return self.nodes[self.offsets[k]:self.offsets[k + 1]], self.values[self.offsets[k]:self.offsets[k + 1]]
+
+    def rebuild(self):
+        """
+        This method rebuilds the sklearn forest.
+        params: None
+        Create every tree from its node and value arrays --> put the trees back into the forest.
+        returns: sklearn forest
+        """
+        if self.model is None:
+            from sklearn.tree._tree import Tree
+            estimators = list()
+            for k, (tree_shell, n_features, n_classes, n_outputs, max_depth) in enumerate(self.trees):
+                nodes, values = self.tree_arrays(k)
+                tree = Tree(n_features, n_classes, n_outputs)
+                tree.__setstate__({'max_depth': max_depth, 'node_count': len(nodes),
+                                   'nodes': np.ascontiguousarray(nodes), 'values': np.ascontiguousarray(values)})
+                estimator = copy.copy(tree_shell)
+                estimator.tree_ = tree
+                estimators.append(estimator)
+            model = copy.copy(self.shell)
+            model.estimators_ = estimators
+            self.model = model
+        return self.model
+
+    def __getattr__(self, name):
+        # only called for the attributes LazyForest does not have: they are the ones of the sklearn forest
+        if name in ('shell', 'trees', 'nodes', 'values', 'offsets', 'flat_arrays', 'model', 'flat_forest') or \
+                name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.rebuild(), name)
@@ -1,71 +1,203 @@
 import pickle
 import os
-import shutil
+import re
+from datetime import datetime
+from file_operations.array_artifact import ArrayArtifact
+from file_operations.model_registry import ModelRegistry
 
 
 class FileOperation:
     """
     This class shall be used to save the model after training and load the saved model for prediction.
+    The models of a training run are saved into a new version of the model registry, which becomes visible to the
+    readers only once it is published. The models are loaded from the version published when the first model is
+    loaded, so all the models of a prediction come from the same training run, or from the legacy
+    models/<name>/<name>.sav layout when no version has been published.
     """
 
-    def __init__(self, file_object, logger_object):
+    def __init__(self, file_object, logger_object, model_cache=None, model_format='pickle'):
         self.file_object = file_object
         self.logger_object = logger_object
         self.model_directory = 'models/'
+        self.registry = ModelRegistry(self.model_directory)
+        self.pending_version = None  # version being written by a training run
+        self.pending_models = dict()  # model name --> file and checksum of the models of the pending version
+        self.version = None  # version the models are loaded from
+        self.manifest = None  # manifest of that version, None in the legacy layout
+        self.version_resolved = False
+        self.model_index = None  # cluster number --> model name, built once per pinned version
+        self.model_cache = model_cache  # ModelCache keeping the loaded models across the predictions of the process
+        # 'pickle' or 'arrays': see ArrayArtifact, the models are then loaded memory-mapped
+        if model_format not in ('pickle', 'arrays'):
+            raise ValueError('Unknown model format %s' % model_format)
+        self.model_format = model_format
+
+    def begin_version(self):
+        """
+        Start a new version of the models.
+        params: None
+        returns: version
+        """
+        self.pending_version = self.registry.create_version()
+        self.pending_models = dict()
+        self.logger_object.log(self.file_object, 'Saving the models into the model version ' + self.pending_version)
+        return self.pending_version
 
     def save_model(self, model, filename):
         """
-        Save the model files into the 'models' directory.
+        Save the model files into the version being written.
         params: model, filename
-        Create a file with required file name inside the model directory --> if path exists --> delete it --> else
-        create the path --> save the model.
+        Start a version if none is being written --> save the model into the version directory, pickled or in the
+        array format --> record its file and checksum for the manifest. The models of the published versions are left
+        untouched.
         returns: status
         """
         self.logger_object.log(self.file_object, 'Entered the save_model method of the FileOperation class')
-        path = os.path.join(self.model_directory, filename)  # create seperate directory for each cluster
-        if os.path.isdir(path):  # remove previously existing models for each clusters
-            shutil.rmtree(self.model_directory)
-            os.makedirs(path)
+        if self.pending_version is None:
+            self.begin_version()
+        if self.model_format == 'arrays':
+            file = filename
+            ArrayArtifact.save(model, os.path.join(self.registry.version_path(self.pending_version), file))
         else:
-            os.makedirs(path)  #
-        with open(path + '/' + filename + '.sav', 'wb') as f:
-            pickle.dump(model, f)  # save the model to file
+            file = filename + '.sav'
+            with open(os.path.join(self.registry.version_path(self.pending_version), file), 'wb') as f:
+                pickle.dump(model, f)  # save the model to file
+        path = os.path.join(self.registry.version_path(self.pending_version), file)
+        self.pending_models[filename] = {'file': file, 'format': self.model_format,
+                                         'sha256': self.registry.file_checksum(path)}
         self.logger_object.log(self.file_object, 'Model File ' + filename +
                                ' saved. Exited the save_model method of the Model_Finder class')
         return 'success'
 
+    def abandon_version(self):
+        """
+        Remove the version being written, when the training fails before publishing it.
+        params: None
+        returns: None
+        """
+        if self.pending_version is not None:
+            self.registry.remove_version(self.pending_version)
+            self.logger_object.log(self.file_object, 'Model version ' + self.pending_version + ' removed unpublished')
+            self.pending_version, self.pending_models = None, dict()
+
+    def publish_version(self, clusters):
+        """
+        Publish the version being written.
+        params: clusters (cluster number --> name of the model of the cluster)
+        Write the manifest of the saved models and the cluster map --> swap the pointer to the version --> the
+        following loads use it.
+        returns: version
+        """
+        version = self.pending_version
+        manifest = {'version': version, 'created': datetime.now().isoformat(), 'models': self.pending_models,
+                    'clusters': {str(cluster): name for cluster, name in clusters.items()}}
+        self.registry.publish(version, manifest)
+        self.pending_version, self.pending_models = None, dict()
+        self.version, self.manifest, self.version_resolved = version, manifest, True
+        self.model_index = None
+        self.logger_object.log(self.file_object, 'Model version ' + version + ' published')
+        return version
+
+    def resolve_version(self):
+        """
+        Pin the version the models are loaded from.
+        params: None
+        Resolve the published version on the first call only, through the model cache when there is one --> read its
+        manifest.
+        returns: manifest, None in the legacy layout
+        """
+        if not self.version_resolved:
+            if self.model_cache is not None:  # the version served by the cache, its manifest is read once
+                self.version, self.manifest = self.model_cache.resolve(self.registry)
+            else:
+                self.version = self.registry.current_version()
+                if self.version is not None:
+                    self.manifest = self.registry.read_manifest(self.version)
+            self.version_resolved = True
+        return self.manifest
+
     def load_model(self, filename):
         """
         Load the saved model for predictions.
         params: filename
-        Open the directory where the model is present --> load the model.
-        returns: None
+        Resolve the version --> take the model from the model cache if there is one --> else verify the checksum of
+        the model file --> load the model.
+        returns: model
         """
         self.logger_object.log(self.file_object, 'Entered the load_model method of the FileOperation class')
-        with open(self.model_directory + filename + '/' + filename + '.sav', 'rb') as f:
-            self.logger_object.log(self.file_object, 'Model File ' + filename +
-                                   ' loaded. Exited the load_model method of the Model_Finder class')
-            return pickle.load(f)
+        manifest = self.resolve_version()
+        checksum = None
+        if manifest is None:
+            path = self.model_directory + filename + '/' + filename + '.sav'
+        else:
+            entry = manifest['models'][filename]
+            path = os.path.join(self.registry.version_path(self.version), entry['file'])
+            checksum = entry['sha256']
+        try:
+            if self.model_cache is not None:
+                model = self.model_cache.get_model(self.version, filename, path, checksum)
+            else:
+                model = self.registry.read_model(path, checksum)
+        except ValueError as e:
+            self.logger_object.log(self.file_object, str(e))
+            raise
+        self.logger_object.log(self.file_object, 'Model File ' + filename +
+                               ' loaded. Exited the load_model method of the Model_Finder class')
+        return model
+
+    def model_exists(self, filename):
+        """
+        Check whether a model has been saved under the given name.
+        params: filename
+        returns: True if the model file exists, False otherwise
+        """
+        manifest = self.resolve_version()
+        if manifest is None:
+            return os.path.isfile(self.model_directory + filename + '/' + filename + '.sav')
+        return filename in manifest['models']
+
+    def build_model_index(self):
+        """
+        Build the index of the model of every cluster.
+        params: None
+        Read the cluster map of the manifest written at training time --> in the legacy layout, scan the model
+        directory once and match the whole directory names against <model name><cluster number>, so cluster 1 never
+        matches the model of cluster 10.
+        returns: dictionary cluster number --> model name
+        """
+        manifest = self.resolve_version()
+        if manifest is not None:
+            return {int(cluster): name for cluster, name in manifest['clusters'].items()}
+        model_index = dict()
+        pattern = re.compile(r'^([A-Za-z_]+?)(\d+)$')
+        for file in os.listdir(self.model_directory):
+            match = pattern.match(file)
+            if match and os.path.isfile(os.path.join(self.model_directory, file, file + '.sav')):
+                model_index[int(match.group(2))] = file
+        self.logger_object.log(self.file_object, 'Built the index of the legacy models of ' +
+                               str(len(model_index)) + ' clusters')
+        return model_index
 
     def find_correct_model_file(self, cluster_number):
         """
         Find the correct model file for the corresponding cluster.
         params: cluster_number
-        Iterate over all model files in the directory --> return the correct model name
-        returns: None
+        Build the model index on the first call only --> look the cluster up in it.
+        returns: model name
         """
-        model_name = None
         self.logger_object.log(self.file_object,
                                'Entered the find_correct_model_file method of the FileOperation class')
-        folder_name = self.model_directory
-        list_of_files = os.listdir(folder_name)
-        for file in list_of_files:
-            try:
-                if file.index(str(cluster_number)) != -1:
-                    model_name = file
-            except ValueError:
-                continue
-        model_name = model_name.split('.')[0]
+        if self.model_index is None:
+            if self.model_cache is not None:  # built once per version in the process
+                self.resolve_version()
+                self.model_index = self.model_cache.model_index(self.version, self.build_model_index)
+            else:
+                self.model_index = self.build_model_index()
+        try:
+            model_name = self.model_index[int(cluster_number)]
+        except KeyError:
+            self.logger_object.log(self.file_object, 'No model saved for the cluster ' + str(cluster_number))
+            raise KeyError('No model saved for the cluster %s' % cluster_number)
         self.logger_object.log(self.file_object,
                                'Exited the find_correct_model_file method of the Model_Finder class.')
         return model_name
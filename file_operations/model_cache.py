@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from application_logging.logger import AppLogger
+from file_operations.array_artifact import ArrayArtifact, LazyForest
+from file_operations.model_registry import ModelRegistry
+
+
+class ModelCache:
+    """
+    This class keeps the deserialized models in the memory of the process, shared by all the predictions it serves.
+    The published model version is checked at most every check_interval seconds through the status of the version
+    pointer file. A newly published version is loaded in a background thread while the predictions keep using the
+    previous one, and is switched to once all its models are loaded. The models of the older versions are evicted,
+    the least recently used first, when the models held take more than max_bytes. A version which fails to load is
+    logged and not loaded again until the pointer changes or retry_interval seconds have passed.
+    """
+
+    def __init__(self, max_bytes=2 << 30, check_interval=1.0, retry_interval=60.0,
+                 log_path='Prediction_Logs/ModelCacheLog.txt'):
+        self.max_bytes = max_bytes  # bound on the memory of the models held, see entry_bytes
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.log_path = log_path
+        self.logger = AppLogger()
+        self.lock = threading.RLock()
+        self.models = OrderedDict()  # (version, model name) --> (model, size, modification time), in the LRU order
+        self.manifests = dict()  # version --> manifest
+        self.indexes = dict()  # version --> cluster number --> model name
+        self.version = None  # version served, None in the legacy layout
+        self.pointer_status = None  # status of the pointer file when the served version was resolved
+        self.last_check = None
+        self.reloading = None  # version being loaded in the background
+        self.failed_status, self.failed_at = None, None  # status of the pointer when its version failed to load, time
+
+    @staticmethod
+    def file_status(path):
+        """
+        This method returns what identifies a state of a file: a published pointer is replaced by a new file.
+        params: path
+        returns: (inode, size, modification time in ns), or None when the file does not exist
+        """
+        try:
+            status = os.stat(path)
+        except OSError:
+            return None
+        return status.st_ino, status.st_size, status.st_mtime_ns
+
+    def resolve(self, registry):
+        """
+        This method returns the version the predictions use.
+        params: registry (ModelRegistry)
+        Within check_interval of the last check, return the served version --> else compare the status of the pointer
+        file with the one of the served version --> on the first resolution load the manifest of the published version
+        right away --> on a change, load the new version in a background thread and keep serving the current one,
+        unless that version failed to load less than retry_interval seconds ago.
+        returns: version, manifest (None, None in the legacy layout)
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.last_check is not None and now - self.last_check < self.check_interval:
+                return self.version, self.manifests.get(self.version)
+            self.last_check = now
+            status = self.file_status(registry.pointer_path)
+            if status == self.pointer_status:
+                return self.version, self.manifests.get(self.version)
+            version = registry.current_version()
+            if self.version is None or version is None:
+                # nothing loaded yet, or switching from or to the legacy layout: nothing to keep serving meanwhile
+                if version is not None and version not in self.manifests:
+                    self.manifests[version] = registry.read_manifest(version)
+                self.version, self.pointer_status = version, status
+            elif version == self.version:  # the served version published again
+                self.pointer_status = status
+            elif self.reloading is None and (status != self.failed_status or
+                                             now - self.failed_at >= self.retry_interval):
+                self.reloading = version
+                threading.Thread(target=self.preload, args=(registry, version, status), daemon=True).start()
+            return self.version, self.manifests.get(self.version)
+
+    def preload(self, registry, version, status):
+        """
+        This method loads all the models of a version and then switches the predictions to it.
+        params: registry, version, status (status of the pointer file naming the version)
+        returns: None
+        """
+        try:
+            manifest = registry.read_manifest(version)
+            for name, entry in manifest['models'].items():
+                self.get_model(version, name, os.path.join(registry.version_path(version), entry['file']),
+                               entry['sha256'])
+            with self.lock:
+                self.manifests[version] = manifest
+                self.version, self.pointer_status = version, status
+                self.failed_status, self.failed_at = None, None
+                self.evict()
+        except Exception as e:  # a missing, corrupt or half written version, or a model which can't be unpickled
+            with self.lock:
+                self.failed_status, self.failed_at = status, time.monotonic()
+                served = self.version
+            self.log('Model version %s could not be loaded, still serving %s, retrying in %ss or when the pointer '
+                     'changes: %r' % (version, served, self.retry_interval, e))
+        finally:
+            with self.lock:
+                self.reloading = None
+
+    def log(self, message):
+        """
+        This method writes a message to the log file of the cache.
+        params: message
+        returns: None
+        """
+        try:
+            with open(self.log_path, 'a+') as f:
+                self.logger.log(f, message)
+        except OSError:
+            pass  # the predictions go on without the log
+
+    def get_model(self, version, name, path, checksum=None):
+        """
+        This method returns a model, loading it on the first request only.
+        params: version, name, path (model file), checksum (expected sha256 of the file)
+        The files of a published version never change, the legacy files are loaded again when they were modified.
+        returns: model
+        """
+        key = (version, name)
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is not None and (version is not None or entry[2] == os.path.getmtime(path)):
+                self.models.move_to_end(key)
+                self.evict()  # the forests rebuilt since the last request count now
+                return entry[0]
+        model = ModelRegistry.read_model(path, checksum)
+        with self.lock:
+            # the arrays of a model in the array format are memory-mapped, shared with the other processes until
+            # they are copied, see entry_bytes
+            size = ArrayArtifact.private_bytes(path) if os.path.isdir(path) else os.path.getsize(path)
+            self.models[key] = (model, size, os.path.getmtime(path))
+            self.evict()
+        return model
+
+    @staticmethod
+    def entry_bytes(entry):
+        """
+        This method returns the memory a model held takes in the process: the size of its model file, or of the header
+        of a model in the array format plus what a forest in the array format copied into private memory since it was
+        loaded, like its rebuilt sklearn trees.
+        params: entry (model, size, modification time)
+        returns: bytes
+        """
+        model, size = entry[0], entry[1]
+        if isinstance(model, LazyForest):
+            size += model.private_bytes()
+        return size
+
+    def model_index(self, version, builder):
+        """
+        This method returns the cluster index of a version, built on the first request only.
+        params: version, builder (function building the index)
+        returns: dictionary cluster number --> model name
+        """
+        with self.lock:
+            if version not in self.indexes:
+                self.indexes[version] = builder()
+            return self.indexes[version]
+
+    def evict(self):
+        """
+        This method evicts the least recently used models of the versions not served anymore while the models held
+        take more than max_bytes, and forgets the manifests and the indexes of the versions without any model left.
+        params: None
+        returns: None
+        """
+        with self.lock:
+            total = sum(self.entry_bytes(entry) for entry in self.models.values())
+            for key in list(self.models):
+                if total <= self.max_bytes:
+                    break
+                if key[0] != self.version and key[0] != self.reloading:
+                    total -= self.entry_bytes(self.models.pop(key))
+            cached_versions = {key[0] for key in self.models}
+            for version in list(self.manifests):
+                if version not in cached_versions and version not in (self.version, self.reloading):
+                    del self.manifests[version]
+                    self.indexes.pop(version, None)
+
+    def clear(self):
+        """
+        This method forgets all the models.
+        params: None
+        returns: None
+        """
+        with self.lock:
+            self.models.clear()
+            self.manifests.clear()
+            self.indexes.clear()
+            self.version, self.pointer_status, self.last_check = None, None, None
+            self.failed_status, self.failed_at = None, None
+
+
+# one cache per process, shared by the predictions served by it
+SHARED_CACHE = ModelCache()
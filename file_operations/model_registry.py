@@ -0,0 +1,180 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+from file_operations.array_artifact import ArrayArtifact
+
+MANIFEST_NAME = 'manifest.json'
+POINTER_NAME = 'CURRENT'
+
+
+class ModelRegistry:
+    """
+    This class keeps the models of every training run in a version directory of its own, models/versions/<version>/,
+    next to a manifest of the files, their checksums and the model of every cluster. A version is published by
+    replacing the models/CURRENT pointer file in one rename, so a reader resolving the pointer always gets a complete
+    version, and the files of a published version are never written again.
+    """
+
+    def __init__(self, model_directory='models/', keep_versions=3):
+        self.model_directory = model_directory
+        self.versions_directory = os.path.join(model_directory, 'versions')
+        self.pointer_path = os.path.join(model_directory, POINTER_NAME)
+        self.keep_versions = keep_versions  # published versions kept for the readers still using an older one
+
+    @staticmethod
+    def file_checksum(file_path, block_size=1 << 20):
+        """
+        This method computes the sha256 checksum of a file, or of the names and the contents of the files of a
+        directory.
+        params: file_path, block_size
+        returns: hex digest
+        """
+        sha = hashlib.sha256()
+        if os.path.isdir(file_path):
+            paths = [os.path.join(file_path, name) for name in sorted(os.listdir(file_path))]
+        else:
+            paths = [file_path]
+        for path in paths:
+            if path != file_path:
+                sha.update(os.path.basename(path).encode() + b'\0')
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(block_size), b''):
+                    sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def read_model(path, checksum=None):
+        """
+        This method loads a model file, or a model directory in the array format.
+        params: path, checksum (expected sha256 of the file, not verified when None)
+        returns: model
+        """
+        if checksum is not None and ModelRegistry.file_checksum(path) != checksum:
+            raise ValueError('Checksum mismatch of the model file %s' % path)
+        if os.path.isdir(path):
+            return ArrayArtifact.load(path)
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def version_path(self, version):
+        """
+        This method returns the directory of a version.
+        params: version
+        returns: path
+        """
+        return os.path.join(self.versions_directory, version)
+
+    def create_version(self):
+        """
+        This method creates the directory of a new version. It is not visible to the readers until it is published.
+        params: None
+        The version name starts with the creation time, so the versions sort in the order they were created.
+        returns: version
+        """
+        version = time.strftime('%Y%m%d_%H%M%S') + '_' + uuid.uuid4().hex[:8]
+        os.makedirs(self.version_path(version))
+        return version
+
+    def current_version(self):
+        """
+        This method resolves the published version.
+        params: None
+        returns: version, or None when no version was ever published (models saved in the legacy layout)
+        """
+        try:
+            with open(self.pointer_path, 'r') as f:
+                version = f.read().strip()
+        except OSError:
+            return None
+        return version or None
+
+    def read_manifest(self, version):
+        """
+        This method reads the manifest of a version.
+        params: version
+        returns: manifest dictionary
+        """
+        with open(os.path.join(self.version_path(version), MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+
+    def publish(self, version, manifest):
+        """
+        This method publishes a version.
+        params: version, manifest
+        Write the manifest into the version directory --> write the version name to a temporary pointer file -->
+        rename it over the pointer, which readers see either before or after the swap, never in between --> remove
+        the versions which are not kept anymore.
+        returns: None
+        """
+        manifest_path = os.path.join(self.version_path(version), MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        pointer_tmp = '%s.%s.tmp' % (self.pointer_path, os.getpid())
+        with open(pointer_tmp, 'w') as f:
+            f.write(version)
+        os.replace(pointer_tmp, self.pointer_path)
+        self.prune()
+
+    def versions(self, published=True):
+        """
+        This method lists the versions, the oldest first.
+        params: published (True for the versions with a manifest, False for the ones without)
+        returns: list of versions
+        """
+        if not os.path.isdir(self.versions_directory):
+            return list()
+        return sorted(version for version in os.listdir(self.versions_directory)
+                      if os.path.isfile(os.path.join(self.version_path(version), MANIFEST_NAME)) == published)
+
+    def remove_version(self, version):
+        """
+        This method removes the directory of a version.
+        params: version
+        returns: None
+        """
+        shutil.rmtree(self.version_path(version), ignore_errors=True)
+
+    def prune(self):
+        """
+        This method removes the oldest published versions beyond keep_versions, never the current one, and the
+        versions without a manifest created before the newest published one: their training run ended without
+        publishing them. The versions created after it may still be being written and are left alone.
+        params: None
+        returns: list of removed versions
+        """
+        current = self.current_version()
+        published = self.versions()
+        removed = [version for version in published[:-self.keep_versions] if version != current]
+        if published:
+            removed += [version for version in self.versions(published=False) if version < published[-1]]
+        for version in removed:
+            self.remove_version(version)
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the published model versions')
+    parser.add_argument('command', choices=['list', 'rollback'])
+    parser.add_argument('version', nargs='?', help='version to publish again, for rollback')
+    parser.add_argument('--directory', default='models/')
+    args = parser.parse_args()
+    registry = ModelRegistry(args.directory)
+    if args.command == 'rollback':
+        if args.version not in registry.versions():
+            parser.error('unknown version %s' % args.version)
+        registry.publish(args.version, registry.read_manifest(args.version))
+        print('%s published' % args.version)
+    else:
+        current = registry.current_version()
+        for version in registry.versions():
+            print(('* ' if version == current else '  ') + version)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,6 @@
 import os
 
 from prediction_Validation_Insertion import PredictionValidation
-from train_model import TrainModel
-from training_Validation_Insertion import TrainValidation
 from predict_with_models import Prediction
 
 from flask import Flask, request, render_template
@@ -31,14 +29,14 @@ def predict_route_client():
     try:
         if request.json is not None:
             path = request.json['filepath']
-            pred_val = PredictionValidation(path)
+            pred_val = PredictionValidation(path, export_csv=False)
             pred_val.prediction_validation()  # calling the prediction_validation function
             pred = Prediction(path)
             path = pred.data_prediction()  # predicting for dataset present in database
             return Response("Prediction File created at %s!!!" % path)
         elif request.form is not None:
             path = request.form['filepath']
-            pred_val = PredictionValidation(path)
+            pred_val = PredictionValidation(path, export_csv=False)
             pred_val.prediction_validation()  # calling the prediction_validation function
             pred = Prediction(path)
             path = pred.data_prediction()  # predicting for dataset present in database
@@ -56,8 +54,11 @@ def predict_route_client():
 def train_route_client():
     try:
         if request.json['filepath'] is not None:
+            # the training stack is heavy to import, workers only serving predictions never load it
+            from train_model import TrainModel
+            from training_Validation_Insertion import TrainValidation
             path = request.json['filepath']
-            train_val_obj = TrainValidation(path)
+            train_val_obj = TrainValidation(path, export_csv=False)
             train_val_obj.train_validation()  # calling the training_validation function
             train_model_obj = TrainModel()
             train_model_obj.train_model_on_data()  # training the model for the files in the table
@@ -0,0 +1,164 @@
+import numpy as np
+from file_operations.array_artifact import ArrayArtifact, LazyForest
+
+
+class FlatForest:
+    """
+    This class is an inference engine for the random forest classifiers. The trees of a forest are compiled into one
+    flat array of node records (feature, first child, threshold) and one of the class probabilities of the nodes,
+    every tree laid out breadth first so the two children of a node are next to each other. A batch is traversed
+    through many trees at once, one vectorized step per tree level: a row moves to the first child of its node when
+    its value of the feature is smaller than or equal to the threshold, to the second one otherwise, and the leaves
+    point to themselves with an infinite threshold so the rows stay in them.
+    The predictions are exactly the ones of the sklearn forest: the rows are compared in float32 with the float64
+    thresholds and the class probabilities of the trees are summed in the order of the trees.
+    """
+
+    def __init__(self, nodes, probabilities, roots, max_depth, classes, n_features):
+        self.nodes = nodes  # feature, first child and threshold of every node
+        self.probabilities = probabilities  # class probabilities predicted by the tree of every node
+        self.roots = roots  # root node of every tree
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_features = n_features
+
+    @staticmethod
+    def normalizes_tree_values():
+        """
+        This method tells whether the sklearn trees divide the values of their leaves by their sum to predict the class
+        probabilities: the nodes hold the class counts before sklearn 1.4, and the class fractions from then on.
+        params: None
+        returns: True or False
+        """
+        import sklearn  # imported when a forest is compiled only, like the models themselves
+        return tuple(int(part) for part in sklearn.__version__.split('.')[:2]) < (1, 4)
+
+    @staticmethod
+    def compile(model):
+        """
+        This method compiles a forest into flat node arrays.
+        params: model (sklearn random forest classifier, or LazyForest)
+        A LazyForest saved with its flat arrays is scored from them as they are mapped --> else gather the node
+        arrays of every tree --> shift the children of every tree by the position of its first node --> lay every
+        tree out breadth first --> make the leaves point to themselves --> compute the class probabilities every node
+        predicts, the way the sklearn trees compute them.
+        returns: FlatForest, or None when the model is not a forest classifier with a single output
+        """
+        if isinstance(model, LazyForest) and model.flat_arrays is not None:
+            nodes, probabilities, roots, max_depth, n_features = model.flat_arrays
+            return FlatForest(nodes, probabilities, roots, max_depth, np.asarray(model.shell.classes_), n_features)
+        if isinstance(model, LazyForest):  # read the mapped node arrays without rebuilding the sklearn forest
+            trees = list()
+            for k, (_, n_features, _, n_outputs, max_depth) in enumerate(model.trees):
+                nodes, values = model.tree_arrays(k)
+                trees.append((nodes['left_child'], nodes['right_child'], nodes['feature'], nodes['threshold'], values,
+                              max_depth, n_outputs))
+            classes = model.shell.classes_
+        elif ArrayArtifact.is_forest(model) and hasattr(model, 'classes_'):
+            trees = [(estimator.tree_.children_left, estimator.tree_.children_right, estimator.tree_.feature,
+                      estimator.tree_.threshold, estimator.tree_.value, estimator.tree_.max_depth,
+                      estimator.tree_.n_outputs) for estimator in model.estimators_]
+            n_features = model.estimators_[0].tree_.n_features
+            classes = model.classes_
+        else:
+            return None
+        if any(tree[6] != 1 for tree in trees):
+            return None
+        n_classes = len(classes)
+        node_counts = [len(tree[0]) for tree in trees]
+        roots = np.concatenate([[0], np.cumsum(node_counts)[:-1]]).astype(np.intp)
+        shift = np.repeat(roots, node_counts)
+        left = np.concatenate([tree[0] for tree in trees]).astype(np.intp) + shift
+        right = np.concatenate([tree[1] for tree in trees]).astype(np.intp) + shift
+        is_leaf = left < shift  # the leaves have -1 as children
+        # lay every tree out breadth first, the children of a node next to each other
+        order = list()
+        for root in roots:
+            level = np.array([root])
+            while len(level):
+                order.append(level)
+                internal = level[~is_leaf[level]]
+                level = np.column_stack([left[internal], right[internal]]).ravel()
+        order = np.concatenate(order)
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+        nodes = np.zeros(len(order), dtype=[('feature', np.int32), ('child', np.int32), ('threshold', np.float64)])
+        leaf = is_leaf[order]
+        nodes['feature'] = np.where(leaf, 0, np.concatenate([tree[2] for tree in trees])[order])
+        nodes['child'] = np.where(leaf, np.arange(len(order)), position[np.where(leaf, 0, left[order])])
+        nodes['threshold'] = np.where(leaf, np.inf, np.concatenate([tree[3] for tree in trees])[order])
+        probabilities = np.concatenate([tree[4][:, 0, :n_classes] for tree in trees])[order].astype(np.float64)
+        if FlatForest.normalizes_tree_values():
+            normalizer = probabilities.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            probabilities /= normalizer
+        return FlatForest(nodes, probabilities, position[roots].astype(np.int32), max(tree[5] for tree in trees),
+                          np.asarray(classes), n_features)
+
+    @staticmethod
+    def for_model(model):
+        """
+        This method returns the compiled forest of a model, compiling it on the first call only. It is kept on the
+        model, so a model held by the model cache is compiled once per process.
+        params: model
+        returns: FlatForest, or None when the model is not a forest classifier with a single output
+        """
+        flat_forest = getattr(model, 'flat_forest', None)
+        if flat_forest is None:
+            flat_forest = FlatForest.compile(model)
+            model.flat_forest = flat_forest
+        return flat_forest
+
+    def leaves(self, x, roots):
+        """
+        This method finds the leaf of some trees for every row.
+        params: x (float32 matrix), roots (root nodes of the trees)
+        Start at the roots --> at every level, gather the node records --> move every row to the first child of its
+        node in every tree when its value of the feature of the node is smaller than or equal to the threshold, to the
+        second child otherwise.
+        returns: leaf node matrix, one row per row of x and one column per tree
+        """
+        flat_x = x.ravel()
+        row_starts = (np.arange(len(x), dtype=np.int32) * self.n_features)[:, np.newaxis]
+        node = np.tile(roots, (len(x), 1))
+        for _ in range(self.max_depth):
+            records = self.nodes.take(node)
+            node = records['child'] + (flat_x.take(row_starts + records['feature']) > records['threshold'])
+        return node
+
+    def predict_proba(self, x, chunk_nodes=1 << 16, tree_group=64):
+        """
+        This method predicts the class probabilities.
+        params: x, chunk_nodes (bound on rows times trees traversed at once), tree_group (number of trees traversed
+        at once for the batches too large to go through all the trees at once, their nodes then staying in the cache)
+        Convert the rows to float32 like the sklearn forest --> find the leaves of a chunk of rows in a group of trees
+        --> add the class probabilities of the leaves tree after tree --> divide by the number of trees.
+        returns: probability matrix, one column per class
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if x.ndim != 2 or x.shape[1] != self.n_features:
+            raise ValueError('Expected a matrix of %s features, got the shape %s' % (self.n_features, x.shape))
+        if not np.isfinite(x).all():
+            raise ValueError('Input contains NaN, infinity or a value too large for float32')
+        n_trees = len(self.roots)
+        if len(x) * n_trees <= chunk_nodes:
+            tree_group = n_trees
+        proba = np.zeros((len(x), self.probabilities.shape[1]))
+        for first_tree in range(0, n_trees, tree_group):
+            roots = self.roots[first_tree:first_tree + tree_group]
+            chunk_rows = max(1, chunk_nodes // len(roots))
+            for start in range(0, len(x), chunk_rows):
+                leaf_probabilities = self.probabilities.take(self.leaves(x[start:start + chunk_rows], roots), axis=0)
+                chunk_proba = proba[start:start + chunk_rows]
+                for k in range(len(roots)):
+                    chunk_proba += leaf_probabilities[:, k]
+        proba /= n_trees
+        return proba
+
+    def predict(self, x):
+        """
+        This method predicts the classes.
+        params: x
+        returns: array of classes
+        """
+        return self.classes_.take(np.argmax(self.predict_proba(x), axis=1), axis=0)
@@ -2,7 +2,10 @@ import os
 from pathlib import Path
 import pandas as pd
 from file_operations import file_methods
+from file_operations.model_cache import SHARED_CACHE
+from file_operations.array_artifact import LazyForest
 from data_preprocessing import preprocessing
+from model_inference.flat_forest import FlatForest
 from data_ingestion import data_loader_prediction
 from application_logging.logger import AppLogger
 from Prediction_Raw_Data_Validation.predictionDataValidation import PredictionDataValidation
@@ -13,7 +16,17 @@ class Prediction:
     This class is used to perform prediction on the prediction data.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, data_source='auto', use_model_cache=True, inference_engine='sklearn', flat_max_rows=2000):
+        self.data_source = data_source  # see DataGetterPred: 'auto', 'cache', 'database' or 'csv'
+        # keep the loaded models in memory for the next predictions of the process instead of loading them per request
+        self.model_cache = SHARED_CACHE if use_model_cache else None
+        # 'sklearn', or 'flat' to score the random forests with FlatForest, same predictions. FlatForest is faster for
+        # the small batches only, the clusters of more than flat_max_rows rows are scored by sklearn. The forests saved
+        # in the array format are always scored by FlatForest, from their flat arrays shared between the processes
+        if inference_engine not in ('sklearn', 'flat'):
+            raise ValueError('Unknown inference engine %s' % inference_engine)
+        self.inference_engine = inference_engine
+        self.flat_max_rows = flat_max_rows
         self.file_object = open("Prediction_Logs/Prediction_Log.txt", 'a+')
         self.log_writer = AppLogger()
         self.pred_data_val = PredictionDataValidation(path)
@@ -28,25 +41,39 @@ class Prediction:
         Perform data prediction using the models.
         params: None
         Delete the existing prediction file if exists --> load the prediction data --> check for missing values in the
-        dataset --> impute the missing values if present --> perform data scaling on the prediction data --> load the
-        kmeans model --> predict clusters for the dataset --> create a column with cluster number --> find the correct
-        model for the data --> perform prediction --> save to a csv file.
+        dataset --> impute the missing values if present with the imputer saved during training --> load the kmeans
+        model --> predict clusters for the dataset --> scale the prediction data with the scaler saved during training
+        --> create a column with cluster number --> find the correct model for the data --> perform prediction --> save
+        to a csv file.
         returns: None
         """
         self.pred_data_val.delete_prediction_file()  # deletes the existing prediction file from last run
         self.log_writer.log(self.file_object, 'Start of Prediction')
-        data_getter = data_loader_prediction.DataGetterPred(self.file_object, self.log_writer)
+        data_getter = data_loader_prediction.DataGetterPred(self.file_object, self.log_writer, self.data_source,
+                                                           compact_dtypes=True)
         data = data_getter.get_data()
         preprocessor = preprocessing.Preprocessor(self.file_object, self.log_writer)
+        file_loader = file_methods.FileOperation(self.file_object, self.log_writer, self.model_cache)
         # check if missing values are present in the dataset
         is_null_present, cols_with_missing_values = preprocessor.is_null_present(data)
         # if missing values are there, replace them appropriately.
         if is_null_present:
-            data = preprocessor.impute_missing_values(data, cols_with_missing_values)  # missing value imputation
-        x = preprocessor.scale_numerical_columns(data)
-        file_loader = file_methods.FileOperation(self.file_object, self.log_writer)
+            # the imputer fitted during training is only used to transform
+            imputer = None
+            if file_loader.model_exists('KNNImputer'):
+                imputer = file_loader.load_model('KNNImputer')
+            else:  # models saved before the imputer was saved with them
+                self.log_writer.log(self.file_object, 'No saved imputer found. Fitting one on the prediction data')
+            data = preprocessor.impute_missing_values(data, cols_with_missing_values, imputer)
+        # the KMeans model is fitted on the unscaled features during training, the models on the scaled ones
         kmeans = file_loader.load_model('KMeans')
-        clusters = kmeans.predict(x)
+        clusters = kmeans.predict(data)
+        scaler = None
+        if file_loader.model_exists('StandardScaler'):
+            scaler = file_loader.load_model('StandardScaler')
+        else:  # models saved before the scaler was saved with them
+            self.log_writer.log(self.file_object, 'No saved scaler found. Fitting one on the prediction data')
+        x = preprocessor.scale_numerical_columns(data, scaler)
         x['clusters'] = clusters
         clusters = x['clusters'].unique()
         for i in clusters:
@@ -54,6 +81,10 @@ class Prediction:
             cluster_data = cluster_data.drop(['clusters'], axis=1)
             model_name = file_loader.find_correct_model_file(i)
             model = file_loader.load_model(model_name)
+            if isinstance(model, LazyForest) and model.flat_arrays is not None:
+                model = FlatForest.for_model(model)  # the sklearn forest would be rebuilt into private memory
+            elif self.inference_engine == 'flat' and len(cluster_data) <= self.flat_max_rows:
+                model = FlatForest.for_model(model) or model  # the other models are scored by sklearn
             result = (model.predict(cluster_data))
             final = pd.DataFrame(list(zip(result)), columns=['Predictions'])
             final.to_csv(self._predicted_op_path, header=True, mode='a+')
@@ -7,12 +7,14 @@ from application_logging import logger
 
 class PredictionValidation:
 
-    def __init__(self, path):
+    def __init__(self, path, n_jobs=1, export_csv=True):
         self.raw_data = PredictionDataValidation(path)
         self.dataTransform = DataTransformPredict()
         self.dBOperation = DBOperation()
         self.file_object = open("Prediction_Logs/Prediction_Log.txt", 'a+')
         self.log_writer = logger.AppLogger()
+        self.n_jobs = n_jobs  # number of processes used to validate the batch files
+        self.export_csv = export_csv  # not needed when the data is loaded from the columnar cache or database
 
     def prediction_validation(self):
         """
@@ -25,13 +27,14 @@ class PredictionValidation:
         length_of_date_stamp_in_file, length_of_time_stamp_in_file, column_names, number_of_columns = \
             self.raw_data.values_from_schema()
         regex = self.raw_data.manual_regex_creation()
-        self.raw_data.validation_file_name_raw(regex, length_of_date_stamp_in_file, length_of_time_stamp_in_file)
-        self.raw_data.validate_number_of_columns_in_file(number_of_columns)
-        self.raw_data.validate_if_entire_column_has_missing_values()
-        self.dataTransform.replace_missing_with_null()
+        # file name, column length and missing values validations and the "NULL" replacement in a single pass
+        self.raw_data.validate_files_single_pass(regex, length_of_date_stamp_in_file, length_of_time_stamp_in_file,
+                                                 number_of_columns, self.n_jobs)
         self.dBOperation.create_table_in_db('Prediction', column_names)
         self.dBOperation.insert_good_data_into_table('Prediction')
         self.raw_data.delete_existing_good_data_prediction_folder()
         self.raw_data.move_bad_files_to_archive_bad()
-        self.dBOperation.export_good_data_to_csv('Prediction')
+        if self.export_csv:
+            self.dBOperation.export_good_data_to_csv('Prediction')
+        self.dBOperation.export_good_data_to_columnar_cache('Prediction')
         self.log_writer.log(self.file_object, 'End of validation on files for prediction.')
@@ -1,8 +1,14 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from joblib import Parallel, delayed, cpu_count
 from sklearn.model_selection import train_test_split
 from data_ingestion import data_loader
 from data_preprocessing import preprocessing
 from data_preprocessing import clustering
 from best_model_finder import tuner
+from best_model_finder.search_cache import SearchCache
 from file_operations import file_methods
 from application_logging.logger import AppLogger
 
@@ -12,7 +18,24 @@ class TrainModel:
     This is the Entry point for training the Machine Learning Model.
     """
 
-    def __init__(self):
+    def __init__(self, data_source='auto', n_jobs=-1, elbow_mode='exact', elbow_sample_size=100000,
+                 elbow_validate=False, save_elbow_plot=False, search_strategy='grid', tree_jobs=1, cluster_jobs=1,
+                 use_search_cache=True, model_format='pickle'):
+        self.data_source = data_source  # see DataGetter: 'auto', 'cache', 'database' or 'csv'
+        self.n_jobs = n_jobs  # number of processes used by the parallel training steps, -1 for all the cores
+        # see KMeansClustering.elbow_plot: 'exact', 'sample' (stratified by the labels) or 'minibatch'
+        self.elbow_mode = elbow_mode
+        self.elbow_sample_size = elbow_sample_size
+        # also fit the exact curve and log how far the knee and the WCSS curve of the elbow mode are from it
+        self.elbow_validate = elbow_validate
+        self.save_elbow_plot = save_elbow_plot  # save preprocessing_data/K-Means_Elbow.PNG
+        self.search_strategy = search_strategy  # see ModelFinder: 'grid', 'halving' or 'random'
+        self.tree_jobs = tree_jobs  # cores of each forest fitted by the searches, see ModelFinder.split_jobs
+        # number of clusters trained at the same time in separate processes, the n_jobs cores are shared between them
+        self.cluster_jobs = cluster_jobs
+        # reuse the search results of the clusters whose data did not change since an earlier training
+        self.search_cache = SearchCache() if use_search_cache else None
+        self.model_format = model_format  # see FileOperation: 'pickle' or 'arrays' (memory-mapped by the predictions)
         self.log_writer = AppLogger()
         self.file_object = open("Training_Logs/ModelTrainingLog.txt", 'a+')
 
@@ -20,53 +43,148 @@ class TrainModel:
         """
         Perform all the steps required for training the model on the data.
         params: None
-        Get the data from the source --> separate features and label columns --> check for null values --> if null
-        is present --> impute the missing values --> create optimal number of clusters from the data --> add a new
-        column to the dataset which contains the cluster number --> iterate over clusters --> get all the data
-        corresponding to the current cluster --> split the dataset into train and test --> scale the numerical
-        columns --> find the best model for that cluster data --> store the model with cluster number.
+        Get the data from the source --> separate features and label columns --> fit the imputer --> check for null
+        values --> if null is present --> impute the missing values --> fit the scaler --> create optimal number of
+        clusters from the data --> save the imputer and the scaler --> scale the features once into a float32 matrix
+        --> partition the rows into one block of row positions per cluster --> iterate over clusters, one after the
+        other or in parallel processes --> split the rows of the current cluster into train and test --> find the best
+        model for that cluster data --> store the models with cluster number in the cluster order --> publish the model
+        version.
         returns: None
         """
         self.log_writer.log(self.file_object, 'Start of Training')
         # First get the data from the source
-        data_getter = data_loader.DataGetter(self.file_object, self.log_writer)
+        data_getter = data_loader.DataGetter(self.file_object, self.log_writer, self.data_source,
+                                             compact_dtypes=True)
         data = data_getter.get_data()
         # Now perform the data preprocessing steps
         preprocessor = preprocessing.Preprocessor(self.file_object, self.log_writer)
         # data.replace('?',np.NaN,inplace=True) # replacing '?' with NaN values for imputation
         # create separate features and labels
         x, y = preprocessor.separate_label_feature(data, label_column_name='default payment next month')
+        # fit the imputer once over all the features, it is saved with the models for the prediction data
+        imputer = preprocessor.fit_imputer(x)
         # check if missing values are present in the dataset
-        is_null_present, cols_with_missing_values = preprocessor.is_null_present(x)
+        is_null_present, cols_with_missing_values = preprocessor.is_null_present(x, write_report=True)
         # if missing values are there, replace them appropriately.
         if is_null_present:
-            x = preprocessor.impute_missing_values(x, cols_with_missing_values)  # impute the missing values
+            x = preprocessor.impute_missing_values(x, cols_with_missing_values, imputer)  # impute the missing values
+        # fit the scaler once over all the features, every cluster and the prediction data are scaled with it
+        scaler = preprocessor.fit_scaler(x)
         # now apply the clustering algorithm on the data
         kmeans = clustering.KMeansClustering(self.file_object, self.log_writer)  # initialize kmeans model object
-        number_of_clusters = kmeans.elbow_plot(x)  # using the elbow plot to find the number of optimum clusters
-        # Divide the data into clusters
-        x = kmeans.create_clusters(x, number_of_clusters)
-        # create a new column in the dataset consisting of the corresponding cluster number.
-        x['Labels'] = y
-        # getting the unique clusters from our dataset
-        list_of_clusters = x['Cluster'].unique()
-        # iterate over all the clusters and looking for the best ML algorithm to fit for each individual cluster
-        for i in list_of_clusters:
-            cluster_data = x[x['Cluster'] == i]  # filter the data for each cluster
-            # Prepare the feature and Label columns
-            cluster_features = cluster_data.drop(['Labels', 'Cluster'], axis=1)
-            cluster_label = cluster_data['Labels']
-            # splitting the data into training and test set for each cluster one by one
-            x_train, x_test, y_train, y_test = train_test_split(cluster_features, cluster_label, test_size=1 / 3,
-                                                                random_state=355)
-            train_x = preprocessor.scale_numerical_columns(x_train)
-            test_x = preprocessor.scale_numerical_columns(x_test)
-            model_finder = tuner.ModelFinder(self.file_object, self.log_writer)  # object initialization
-            # getting the best model for each of the clusters
-            best_model_name, best_model = model_finder.get_best_model(train_x, y_train, test_x, y_test)
-            # saving the best model to the directory.
-            file_op = file_methods.FileOperation(self.file_object, self.log_writer)
-            file_op.save_model(best_model, best_model_name + str(i))
+        # using the elbow plot to find the number of optimum clusters
+        number_of_clusters = kmeans.elbow_plot(x, n_jobs=self.n_jobs, mode=self.elbow_mode,
+                                               sample_size=self.elbow_sample_size, labels=y,
+                                               validate=self.elbow_validate, save_plot=self.save_elbow_plot)
+        # the models of this run are saved into a new model version, published once they are all saved
+        file_op = file_methods.FileOperation(self.file_object, self.log_writer, model_format=self.model_format)
+        file_op.begin_version()
+        try:
+            # Divide the data into clusters
+            clusters = kmeans.create_clusters(x, number_of_clusters, file_op)
+            file_op.save_model(imputer, 'KNNImputer')
+            file_op.save_model(scaler, 'StandardScaler')
+            # one float32 matrix of the scaled features shared by all the clusters, scaled in place
+            features = preprocessor.scale_matrix(x.to_numpy(dtype=np.float32), scaler)
+            labels = y.to_numpy()
+            del data, x, y
+            # partition the rows by cluster once: a stable argsort of the clusters gives contiguous blocks of row
+            # positions, one per cluster, in the original row order
+            list_of_clusters, cluster_rows = self.partition_clusters(clusters)
+            # iterate over all the clusters and looking for the best ML algorithm to fit for each individual cluster
+            cluster_jobs = min(self.cluster_jobs, len(list_of_clusters))
+            if cluster_jobs <= 1:
+                results = [self.train_cluster(features, labels, rows, i, self.n_jobs, self.search_strategy,
+                                              self.search_cache, self.file_object, self.tree_jobs)
+                           for i, rows in zip(list_of_clusters, cluster_rows)]
+            else:
+                results = self.train_clusters_in_parallel(features, labels, cluster_rows, list_of_clusters,
+                                                          cluster_jobs)
+            # saving the best models to the directory, in the order of the clusters
+            for i, best_model_name, best_model in results:
+                file_op.save_model(best_model, best_model_name + str(i))
+            # switch the prediction to the models of this run
+            file_op.publish_version({i: best_model_name + str(i) for i, best_model_name, _ in results})
+        except BaseException:  # interrupted runs too
+            # the models of a run which failed are never published, they must not be left in the registry
+            file_op.abandon_version()
+            self.log_writer.log(self.file_object, 'Unsuccessful End of Training')
+            raise
         # logging the successful Training
         self.log_writer.log(self.file_object, 'Successful End of Training')
         self.file_object.close()
+
+    @staticmethod
+    def partition_clusters(clusters):
+        """
+        Partition the rows by cluster.
+        params: clusters (cluster number of every row)
+        Stable argsort of the cluster numbers --> split the sorted row positions at the cluster boundaries, every block
+        being a view on the same array --> skip the empty clusters.
+        returns: list of cluster numbers, list of row position blocks
+        """
+        order = np.argsort(clusters, kind='stable')
+        counts = np.bincount(clusters)
+        blocks = np.split(order, np.cumsum(counts)[:-1])
+        list_of_clusters = [int(i) for i in np.flatnonzero(counts)]
+        return list_of_clusters, [blocks[i] for i in list_of_clusters]
+
+    def train_clusters_in_parallel(self, features, labels, cluster_rows, list_of_clusters, cluster_jobs):
+        """
+        Train the clusters at the same time in separate processes.
+        params: features, labels, cluster_rows (row positions of every cluster), list_of_clusters, cluster_jobs
+        Save the feature matrix and the labels to .npy files --> open them memory-mapped, so the workers map the same
+        files instead of receiving a pickled copy of the data --> share the cores between the processes --> train every
+        cluster in a worker --> collect the results in the order of the clusters --> remove the files.
+        returns: list of (cluster number, best model name, best model)
+        """
+        total_jobs = cpu_count() if self.n_jobs is None or self.n_jobs < 0 else self.n_jobs
+        model_jobs = max(1, total_jobs // cluster_jobs)
+        self.log_writer.log(self.file_object, 'Training ' + str(len(list_of_clusters)) + ' clusters in ' +
+                            str(cluster_jobs) + ' processes of ' + str(model_jobs) + ' cores')
+        self.file_object.flush()  # the workers append to the same log file
+        directory = tempfile.mkdtemp(prefix='training_matrix_')
+        try:
+            np.save(os.path.join(directory, 'features.npy'), features)
+            np.save(os.path.join(directory, 'labels.npy'), labels)
+            features = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+            labels = np.load(os.path.join(directory, 'labels.npy'), mmap_mode='r')
+            results = Parallel(n_jobs=cluster_jobs)(
+                delayed(self.train_cluster)(features, labels, rows, i, model_jobs, self.search_strategy,
+                                            self.search_cache, tree_jobs=self.tree_jobs)
+                for i, rows in zip(list_of_clusters, cluster_rows))
+            del features, labels
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return results
+
+    @staticmethod
+    def train_cluster(features, labels, rows, cluster_number, n_jobs, search_strategy, search_cache=None,
+                      file_object=None, tree_jobs=1):
+        """
+        Find the best model for one cluster.
+        params: features (scaled feature matrix of all the clusters), labels, rows (row positions of the cluster),
+        cluster_number, n_jobs, search_strategy, search_cache, file_object (log file, a worker process opens its own
+        when None), tree_jobs
+        Split the row positions of the cluster into train and test --> gather the train and test rows of the scaled
+        matrix --> find the best model for that cluster data.
+        returns: cluster_number, best_model_name, best_model
+        """
+        own_log = file_object is None
+        if own_log:
+            file_object = open("Training_Logs/ModelTrainingLog.txt", 'a+')
+        log_writer = AppLogger()
+        try:
+            # splitting the row positions into training and test set, the same split as splitting the cluster data
+            train_rows, test_rows = train_test_split(rows, test_size=1 / 3, random_state=355)
+            train_x, y_train = features[train_rows], labels[train_rows]
+            test_x, y_test = features[test_rows], labels[test_rows]
+            model_finder = tuner.ModelFinder(file_object, log_writer, n_jobs=n_jobs, tree_jobs=tree_jobs,
+                                             search_strategy=search_strategy, search_cache=search_cache)
+            # getting the best model for each of the clusters
+            best_model_name, best_model = model_finder.get_best_model(train_x, y_train, test_x, y_test)
+        finally:
+            if own_log:
+                file_object.close()
+        return cluster_number, best_model_name, best_model
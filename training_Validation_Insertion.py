@@ -1,6 +1,7 @@
 from Training_Raw_data_validation.rawValidation import RawDataValidation
 from DataTypeValidation_Insertion_Training.DataTypeValidation import DBOperation
 from DataTransform_Training.DataTransformation import DataTransform
+from data_validation.manifest import FileManifest
 from application_logging import logger
 import os
 
@@ -10,32 +11,56 @@ class TrainValidation:
     This class has been written for the validation of the training data given by the client.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, n_jobs=1, export_csv=True, use_manifest=True):
+        self.path = path
         self.raw_data = RawDataValidation(path)
         self.data_transform = DataTransform()
         self.dBOperation = DBOperation()
         self.cwd = os.getcwd()
         self.file_object = open(self.cwd + 'Training_Main_Log.txt', 'a+')
         self.log_writer = logger.AppLogger()
+        self.n_jobs = n_jobs  # number of processes used to validate the batch files
+        self.export_csv = export_csv  # not needed when the data is loaded from the columnar cache or database
+        self.use_manifest = use_manifest  # only process the files which are new or changed since the last run
 
     def train_validation(self):
         """
         Perform data validation on the training data.
         params: None
-        Get the data specifications from the training schema --> perform data validation.
+        Get the data specifications from the training schema --> find the new or changed files with the manifest -->
+        perform data validation on them --> insert the good files into the table.
         returns: None
         """
         self.log_writer.log(self.file_object, 'Start of Validation on files for Training')
         length_of_date_stamp_in_file, length_of_time_stamp_in_file, column_names, number_of_columns = \
             self.raw_data.values_from_schema()
         regex = self.raw_data.manual_regex_creation()
-        self.raw_data.validation_file_name_raw(regex, length_of_date_stamp_in_file, length_of_time_stamp_in_file)
-        self.raw_data.validate_number_of_columns_in_file(number_of_columns)
-        self.raw_data.validate_if_entire_column_has_missing_values()
-        self.data_transform.replace_missing_with_null()
         self.dBOperation.create_table_in_db('Training', column_names)
-        self.dBOperation.insert_good_data_into_table('Training')
+        manifest = None
+        filenames = os.listdir(self.path)
+        if self.use_manifest:
+            manifest = FileManifest(self.dBOperation.path + 'Training.db', self.path)
+            filenames, changed_files = manifest.pending_files(filenames)
+            # rows of changed files or rows the manifest does not know about can't be removed one file at a time,
+            # so in that case the table is rebuilt from all the files
+            if changed_files or self.dBOperation.count_rows_in_table('Training') != manifest.inserted_row_count():
+                self.log_writer.log(self.file_object, 'Manifest out of sync with the table. Rebuilding the table')
+                self.dBOperation.clear_good_data_table('Training')
+                manifest.reset()
+                filenames = os.listdir(self.path)
+            self.log_writer.log(self.file_object, '%s new or changed files to validate' % len(filenames))
+        # file name, column length and missing values validations and the "NULL" replacement in a single pass
+        verdicts = self.raw_data.validate_files_single_pass(regex, length_of_date_stamp_in_file,
+                                                            length_of_time_stamp_in_file, number_of_columns,
+                                                            self.n_jobs, filenames)
+        if manifest is not None:
+            manifest.record_verdicts(verdicts)
+        self.dBOperation.insert_good_data_into_table('Training', manifest)
+        if manifest is not None:
+            manifest.close()
         self.raw_data.delete_existing_good_data_training_folder()
         self.raw_data.move_bad_files_to_archive_bad()
-        self.dBOperation.export_good_data_to_csv('Training')
+        if self.export_csv:
+            self.dBOperation.export_good_data_to_csv('Training')
+        self.dBOperation.export_good_data_to_columnar_cache('Training')
         self.file_object.close()